@@ -1,8 +1,11 @@
 import os
 import sys
+import tempfile
 from argparse import ArgumentParser
+from multiprocessing import Pool
 
 import numpy as np
+from feature_matrix import write_matrices
 
 """
 This script takes an alphabet (alphabets defined below) and a fasta file (*.fa
@@ -14,17 +17,29 @@ The score of each subsequence is the product of the PFM probabilities at each
 position for the alphabet letter at each position in the subsequence.
 The final score for the entire sequence is the sum of the top N scores where
 N is provided by the user.
+For alphabets and PFM widths with few possible subsequences (e.g. seq-4 up
+to width 9, struct-2) the scores of all subsequences are precomputed once
+and each subsequence is scored by a single table lookup.
 
 USAGE:
-    PFM_scan.py -a <alphabet> -f <fastafile> -p <PFMprefix> -t <topNscores>
+    PFM_scan.py -a <alphabet> -f <fastafile> -p <PFMprefix> -n <topNscores>
 
-    **ALL ARGUMENTS MUST BE PROVIDED**
+    **ARGUMENTS -a, -f, -p AND -n (OR -t) MUST BE PROVIDED**
+
+    Several alphabets and files can be scanned in one call by giving comma
+    separated lists to -a and -f. The text {alph} in -f, -p and -o is
+    replaced by each alphabet name in turn. Ex:
+    PFM_scan.py -a seq-4,struct-2 -f {alph}/fg_LR.fa,{alph}/bg_LR.fa
+                -p {alph}/PFM -o {alph} -n 4
 
   Arguments:
     -h,--help    Print help message
     -a,--alph    Alphabet used in the PFMs. Can be: seq-4, seq-struct-8,
                  seq-struct-16, seq-struct-28, struct-2, struct-4, struct-7
     -f,--fasta   Path to uncompressed fasta with sequences to scan
+                 OR an alphabet annotation table (*_alphabet_annotations.tab)
+                 in which case -H must also be provided
+                 OR an annotation store directory (see annotation_store.py)
     -p,--prefix  Prefix of the PFM files. Ex. to use files called PFM_1.txt
                  PFM_2.txt and PFM_3.txt use: PFM_
                  PFMs must be in the format position x alphabet letter. Ex:
@@ -34,15 +49,57 @@ USAGE:
                     U    0.1    0.5    0      0
     -n,--topN    Number of top subsequence scores to add for total sequence
                  score. A value of 1 is equivalent to the max score.
+                 Several comma separated values, Ex. 1,2,3,4,5, are scored
+                 in one pass: the top windows are selected once for the
+                 largest value and a file is written for each value
+    -t,--threshold
+                 Report every window scoring at least this fraction (0-1] of
+                 the best possible score of a PFM instead of top N sums
+                 (-n is then not needed). Windows are scored position by
+                 position and abandoned as soon as the best score they can
+                 still reach falls below the threshold
+    -o,--outdir  Directory to write output files to. Default: .
+    -H,--header  annotation_alphabets_header.tab naming the columns of
+                 alphabet annotation tables given to -f
+    -w,--workers Number of processes used for scoring. Default: 1
+                 Sequences are split into chunks of similar total length and
+                 results are written in input order
+    -P,--precision
+                 Precision used to compute scores: float64, float32 or int16.
+                 Default: float64
+                 float32 scores log-probabilities in float32. int16 uses
+                 fixed-point log-probabilities (1/1024 steps, probabilities
+                 below exp(-32) are rounded up to it) summed in int32, only
+                 the top N window scores are converted back to float32.
+                 Use precision_report.py to compare with float64 scores
+    -b,--binary  Write scores as float32 feature matrices (see
+                 feature_matrix.py) instead of tab separated tables
+    -d,--double  With -b, write float64 matrices, for reference scores
+                 compared by precision_report.py
+    -u,--unique  Score each distinct sequence once and copy its scores to
+                 every identical sequence, for libraries with many duplicate
+                 probes. Scores of up to UNIQUE_PROBES distinct sequences
+                 are kept for reuse in later batches of the same file
 OUTPUT:
-A single file in the current directory called:
+A file for each alphabet and input file in the output directory called:
         FF_PFM_scan_sum_top_N.tab
     - FF is the name of fasta file: /path/to/fasta/FF.fa
-    - N is the number of subsequence scores added
+      or PP for an annotation table: /path/to/PP_alphabet_annotations.tab
+      or an annotation store: /path/to/PP_store
+    - N is the number of subsequence scores added, with a file for each
+      value given to -n
+When several alphabets are scanned, alphabets without any PFMs are skipped
 File format:
 seq_ID    PFM_file_name_1    PFM_file_name_2    ...
 fg_1      0.923394           0.002589           ...
 fg_2      0.000012           0.014342           ...
+With -t T the file is FF_PFM_scan_hits_T.tab, with a line for each window
+scoring above the threshold, ordered by sequence, start and PFM:
+seq_ID    PFM                start    score
+fg_1      PFM_file_name_1    3        0.923394
+With -b the file is FF_PFM_scan_sum_top_N.npy, a float32 (float64 with -d)
+matrix of the scores (sequence x PFM, without sequence IDs), and the PFM file names are
+written one per line to FF_PFM_scan_sum_top_N.columns
 """
 # ALPHABET DEFINITIONS
 letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
@@ -58,117 +115,794 @@ alphabets = {
     "seq-struct-28": {list(letters[0:28])[k]: k for k in range(28)},
 }
 
+# Number of sequence letters scored together in one batch
+BATCH_RESIDUES = 200000
+
+# Number of distinct sequences whose scores are kept for reuse with -u
+UNIQUE_PROBES = 2**20
+
+# Number of windows whose scores are summed together
+WINDOW_BLOCK = 16384
+
+# Scoring precisions: float64 (default), float32 or int16 fixed-point
+# log-probabilities with LOG_SCALE steps per natural log unit, summed in int32.
+# Log-probabilities below LOG_FLOOR (including those of zero probabilities)
+# are quantized to LOG_FLOOR
+precisions = ["float64", "float32", "int16"]
+LOG_SCALE = 1024
+LOG_FLOOR = np.iinfo(np.int16).min / LOG_SCALE
+
+# Largest k-mer score table (see kmer_tables); stacks of PFMs whose tables
+# would be larger are split into several tables, PFMs whose own table would
+# be larger are scored with the general kernel
+KMER_TABLE_BYTES = 2**26
+
+# Fraction of (window, PFM) pairs still able to reach the threshold below
+# which threshold scanning only scores the remaining pairs
+SPARSE_FRACTION = 0.25
+
+# Byte value to alphabet index lookup tables, -1 marks letters that are not
+# in the alphabet
+alphabet_lookups = dict()
+for a in alphabets:
+    alphabet_lookups[a] = np.full(256, -1, dtype=np.int16)
+    for letter, k in alphabets[a].items():
+        alphabet_lookups[a][ord(letter)] = k
+
+
+def read_PFM(filename):
+    """Read a PFM file (alphabet letter x position) into a position x letter array."""
+    with open(filename) as PFM_file:
+        PFM = [[float(i) for i in line.strip().split("\t")[1:]] for line in PFM_file]
+    return np.array(PFM).T
+
+
+def log_PFM(PFM):
+    """Natural log of PFM probabilities; zero probabilities become -inf."""
+    with np.errstate(divide="ignore"):
+        return np.log(PFM)
+
+
+def encode_sequence(sequence, alph):
+    """Convert a sequence into a uint8 array of alphabet indices (one per letter)."""
+    codes = alphabet_lookups[alph][np.frombuffer(sequence.encode(), dtype=np.uint8)]
+    if (codes < 0).any():
+        bad = sequence[int(np.argmax(codes < 0))]
+        raise ValueError(f"Letter '{bad}' is not in alphabet {alph}")
+    return codes.astype(np.uint8)
+
+
+def encode_sequences(sequences, alph):
+    """
+    Encode a batch of sequences into one concatenated code array.
+    Returns (codes, offsets) where sequence i is codes[offsets[i]:offsets[i + 1]].
+    """
+    offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+    np.cumsum([len(sequence) for sequence in sequences], out=offsets[1:])
+    return encode_sequence("".join(sequences), alph), offsets
+
+
+def quantize_log_PFM(logp):
+    """int16 fixed-point log-probabilities (LOG_SCALE steps per unit)."""
+    return np.round(np.maximum(logp, LOG_FLOOR) * LOG_SCALE).astype(np.int16)
+
+
+def stack_PFMs(PFM_names, PFMs, precision="float64"):
+    """
+    Group log-PFMs by width and stack each group into a single lookup table of
+    shape (width, alphabet size, number of PFMs), so that the log-probabilities
+    of one letter at one position for every PFM are contiguous. The tables are
+    float64, float32 or quantized int16 (see quantize_log_PFM) for the given
+    precision.
+    Returns a list of (column indices in PFM_names, stacked log-PFMs).
+    """
+    widths = dict()
+    for i, pn in enumerate(PFM_names):
+        widths.setdefault(len(PFMs[pn]), []).append(i)
+    groups = []
+    for cols in widths.values():
+        logp = np.stack([PFMs[PFM_names[i]] for i in cols], axis=-1)
+        if precision == "int16":
+            logp = quantize_log_PFM(logp)
+        groups.append((np.array(cols), np.ascontiguousarray(logp, dtype=np.dtype(precision))))
+    return groups
+
+
+def score_dtype(PFM_groups):
+    """Type of the sequence scores: float64, or float32 for reduced precisions."""
+    if all(logp.dtype == np.float64 for cols, logp in PFM_groups):
+        return np.dtype(np.float64)
+    return np.dtype(np.float32)
+
+
+def ragged_windows(offsets, width, min_windows):
+    """
+    Positions in a concatenated code buffer of every window of the given width
+    that lies within a single sequence, for the sequences holding at least
+    min_windows such windows. Windows crossing sequence boundaries are left out.
+    Returns (window starts, indices of the scored sequences, index of the
+    first window of each scored sequence).
+    """
+    n_windows = np.diff(offsets) - width + 1
+    scored = np.flatnonzero(n_windows >= min_windows)
+    n_windows = n_windows[scored]
+    segments = np.zeros(len(scored), dtype=np.int64)
+    np.cumsum(n_windows[:-1], out=segments[1:])
+    starts = np.arange(n_windows.sum()) + np.repeat(offsets[scored] - segments, n_windows)
+    return starts, scored, segments
+
+
+def score_windows(codes, starts, logp):
+    """
+    Score the windows starting at the given positions of a concatenated code
+    buffer with a stack of equal width log-PFMs (see stack_PFMs).
+    Log-probabilities are summed position by position and transformed back
+    with exp so each score is the product of the PFM probabilities. Windows
+    are scored in blocks of WINDOW_BLOCK so the running sums stay in cache.
+    Quantized int16 log-PFMs are summed in int32 and left in the log domain;
+    they are only transformed back for the top scores (see sum_top_Ns).
+    Returns an array of shape (windows, PFMs).
+    """
+    quantized = logp.dtype == np.int16
+    scores = np.empty((len(starts), logp.shape[2]), dtype=np.int32 if quantized else logp.dtype)
+    for b in range(0, len(starts), WINDOW_BLOCK):
+        block_starts = starts[b : b + WINDOW_BLOCK]
+        block = scores[b : b + WINDOW_BLOCK]
+        if quantized:
+            block[:] = logp[0].take(codes[block_starts], axis=0)
+        else:
+            logp[0].take(codes[block_starts], axis=0, out=block)
+        for j in range(1, len(logp)):
+            block += logp[j].take(codes[block_starts + j], axis=0)
+        if not quantized:
+            np.exp(block, out=block)
+    return scores
+
+
+def kmer_tables(PFM_groups):
+    """
+    Score tables of every possible window (k-mer) for the stacks of PFMs (see
+    stack_PFMs) whose alphabet size and width allow it, e.g. seq-4 PFMs of
+    width up to 9 or struct-2 PFMs of any usual width. Row k of a table holds
+    the window scores of k-mer k (see kmer_codes) for a run of PFMs of the
+    stack, computed exactly as score_windows would.
+    Returns a list matching PFM_groups holding None for stacks scored with
+    the general kernel, or a list of (stack columns, table).
+    """
+    tables = []
+    for cols, logp in PFM_groups:
+        quantized = logp.dtype == np.int16
+        dtype = np.dtype(np.int32) if quantized else logp.dtype
+        per_table = KMER_TABLE_BYTES // (logp.shape[1] ** len(logp) * dtype.itemsize)
+        if per_table == 0:
+            tables.append(None)
+            continue
+        group_tables = []
+        for first in range(0, logp.shape[2], per_table):
+            run = logp[:, :, first : first + per_table]
+            # Add positions in the same order as score_windows
+            table = run[0].astype(dtype)
+            for j in range(1, len(run)):
+                table = (table[:, None, :] + run[j][None, :, :]).reshape(-1, run.shape[2])
+            if not quantized:
+                np.exp(table, out=table)
+            group_tables.append((slice(first, first + run.shape[2]), table))
+        tables.append(group_tables)
+    return tables
+
+
+def kmer_codes(codes, width, n_letters):
+    """
+    Integer code of the k-mer of the given width starting at every position
+    of a code buffer (windows running past the end are left out), the first
+    letter being the most significant digit in base n_letters.
+    """
+    n = len(codes) - width + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.intp)
+    kmers = codes[:n].astype(np.intp)
+    for j in range(1, width):
+        kmers *= n_letters
+        kmers += codes[j : j + n]
+    return kmers
+
+
+def score_kmers(kmers, starts, group_tables, n_PFMs):
+    """
+    Score the windows starting at the given positions with k-mer score tables
+    (see kmer_tables), one table lookup per window.
+    Returns an array of shape (windows, PFMs) as score_windows does.
+    """
+    window_kmers = kmers[starts]
+    if len(group_tables) == 1:
+        return group_tables[0][1].take(window_kmers, axis=0)
+    scores = np.empty((len(starts), n_PFMs), dtype=group_tables[0][1].dtype)
+    for cols, table in group_tables:
+        scores[:, cols] = table.take(window_kmers, axis=0)
+    return scores
+
+
+def sum_top_Ns(scores, topNs, axis=-1):
+    """
+    Sums of the N largest scores along an axis for each N of topNs, using one
+    partial selection of the max(topNs) largest scores. The N largest are
+    summed in increasing order whatever the other values of topNs, so each
+    sum is the same as when scanning with that N only. Sums of more scores
+    than there are along the axis are 0.
+    Quantized int32 log-scores (see score_windows) are transformed back to
+    float32 scores after the selection.
+    Returns an array with a new axis over topNs in place of the reduced axis.
+    """
+    n_windows = scores.shape[axis]
+    k = min(max(topNs), n_windows)
+    top = np.partition(scores, n_windows - k, axis=axis).take(range(n_windows - k, n_windows), axis=axis)
+    top = np.sort(top, axis=axis)
+    if top.dtype == np.int32:
+        top = np.exp(top.astype(np.float32) / LOG_SCALE)
+    sums = []
+    for topN in topNs:
+        if topN > k:
+            sums.append(np.zeros_like(top.take(0, axis=axis)))
+        else:
+            sums.append(top.take(range(k - topN, k), axis=axis).sum(axis=axis))
+    return np.stack(sums, axis=axis)
+
+
+def segmented_sum_top_Ns(scores, segments, topNs):
+    """
+    Sums of the N largest window scores (windows x PFMs) within each segment
+    of consecutive windows (segments holds the first window of each), for
+    each N of topNs. Segments holding the same number of windows are
+    gathered into one (segments x windows x PFMs) block and reduced together
+    with sum_top_Ns.
+    Returns an array of shape (segments, len(topNs), PFMs).
+    """
+    n_windows = np.diff(np.append(segments, len(scores)))
+    sums = np.zeros(
+        (len(segments), len(topNs), scores.shape[1]), dtype=np.float64 if scores.dtype == np.float64 else np.float32
+    )
+    for n in np.unique(n_windows):
+        idx = np.flatnonzero(n_windows == n)
+        sums[idx] = sum_top_Ns(scores[segments[idx, None] + np.arange(n)], topNs, axis=1)
+    return sums
+
+
+def score_codes(codes, offsets, PFM_groups, n_PFMs, topNs, tables=None):
+    """
+    Score a batch of encoded sequences (see encode_sequences) with all PFMs in
+    PFM_groups (from stack_PFMs), summing the top N window scores for each N
+    of topNs. Windows of all sequences are scored together on the
+    concatenated codes, whatever the sequence lengths. Stacks with k-mer
+    score tables (tables, from kmer_tables) are scored by table lookup on
+    k-mer codes computed once for all of their PFMs.
+    Returns an array of shape (sequences, len(topNs), PFMs) in the order
+    given, float32 if the PFMs are stacked with a reduced precision. Sequences
+    shorter than (PFM width + N - 1) receive a score of 0.
+    """
+    codes = np.asarray(codes)
+    scores = np.zeros((len(offsets) - 1, len(topNs), n_PFMs), dtype=score_dtype(PFM_groups))
+    for g, (cols, logp) in enumerate(PFM_groups):
+        starts, scored, segments = ragged_windows(offsets, len(logp), min(topNs))
+        if not len(scored):
+            continue
+        if tables is not None and tables[g] is not None:
+            kmers = kmer_codes(codes[offsets[0] : offsets[-1]], len(logp), logp.shape[1])
+            window_scores = score_kmers(kmers, starts - offsets[0], tables[g], len(cols))
+        else:
+            window_scores = score_windows(codes, starts, logp)
+        scores[np.ix_(scored, range(len(topNs)), cols)] = segmented_sum_top_Ns(window_scores, segments, topNs)
+    return scores
+
+
+def best_suffix(logp):
+    """
+    Best possible log-score of the positions from j to the end of each PFM in
+    a stack (see stack_PFMs), for j from 0 to the PFM width.
+    Returns an array of shape (width + 1, PFMs), the last row is 0.
+    """
+    best = logp.max(axis=1).astype(np.int32 if logp.dtype == np.int16 else logp.dtype)
+    suffix = np.zeros((len(logp) + 1, logp.shape[2]), dtype=best.dtype)
+    suffix[:-1] = np.cumsum(best[::-1], axis=0)[::-1]
+    return suffix
+
+
+def hits_codes(codes, offsets, PFM_groups, threshold):
+    """
+    Find the windows of a batch of encoded sequences (see encode_sequences)
+    scoring at least threshold times the best possible score of a PFM.
+    Windows are scored position by position and a (window, PFM) pair is
+    abandoned as soon as its score so far plus the best possible score of the
+    remaining positions (see best_suffix) falls below the cutoff.
+    Returns (sequence indices, PFM indices, window starts within the
+    sequences, scores) of the hits, ordered by sequence, start and PFM.
+    """
+    codes = np.asarray(codes)
+    hits = []
+    for cols, logp in PFM_groups:
+        quantized = logp.dtype == np.int16
+        suffix = best_suffix(logp)
+        cutoff = suffix[0] + np.log(threshold) * (LOG_SCALE if quantized else 1)
+        starts, scored, segments = ragged_windows(offsets, len(logp), 1)
+        n_PFMs = logp.shape[2]
+        for b in range(0, len(starts), WINDOW_BLOCK):
+            block_starts = starts[b : b + WINDOW_BLOCK]
+            # Score all (window, PFM) pairs while most of them are still alive
+            partial = logp[0].take(codes[block_starts], axis=0).astype(suffix.dtype, copy=False)
+            j = 1
+            alive = partial + suffix[j] >= cutoff
+            while j < len(logp) and np.count_nonzero(alive) > SPARSE_FRACTION * alive.size:
+                partial += logp[j].take(codes[block_starts + j], axis=0)
+                j += 1
+                alive = partial + suffix[j] >= cutoff
+            # Then only the pairs that can still reach the cutoff
+            window, PFM = np.nonzero(alive)
+            partial = partial[window, PFM]
+            for j in range(j, len(logp)):
+                partial += logp[j].take(codes[block_starts[window] + j].astype(np.intp) * n_PFMs + PFM)
+                keep = partial + suffix[j + 1].take(PFM) >= cutoff.take(PFM)
+                window, PFM, partial = window[keep], PFM[keep], partial[keep]
+            window += b
+            seq = scored[np.searchsorted(segments, window, side="right") - 1]
+            hits.append((seq, cols[PFM], starts[window] - offsets[seq], partial / LOG_SCALE if quantized else partial))
+    if not hits:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+    seq, PFM, start, score = [np.concatenate(h) for h in zip(*hits)]
+    order = np.lexsort((PFM, start, seq))
+    return seq[order], PFM[order], start[order], np.exp(score[order]).astype(score_dtype(PFM_groups))
+
+
+def format_scores(seq_ids, scores, lengths, widths, topN):
+    """
+    Yield output lines for scored sequences. Scores of sequences too short to
+    hold topN windows of a PFM are written as 0. float32 scores are written
+    with the 9 significant digits needed to read them back exactly.
+    """
+    short = lengths[:, None] < widths[None, :] + topN - 1
+    rows = scores.tolist()
+    for k in np.flatnonzero(short.any(axis=1)):
+        rows[k] = [0 if s else i for i, s in zip(rows[k], short[k].tolist())]
+    to_text = str if scores.dtype == np.float64 else "{:.9g}".format
+    for seq_id, row in zip(seq_ids, rows):
+        yield seq_id + "\t" + "\t".join(map(to_text, row)) + "\n"
+
+
+def chunk_bounds(offsets, n_chunks):
+    """
+    Split a batch of encoded sequences into at most n_chunks runs of
+    consecutive sequences holding roughly equal numbers of letters.
+    Returns a list of (first sequence, last sequence + 1).
+    """
+    targets = np.linspace(0, offsets[-1], n_chunks + 1)
+    bounds = np.unique(np.searchsorted(offsets, targets, side="left"))
+    bounds[0] = 0
+    bounds[-1] = len(offsets) - 1
+    bounds = np.unique(bounds)
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+
+# PFMs and parameters set in each worker process by init_worker
+worker_state = dict()
+
+
+def init_worker(PFM_groups, n_PFMs, topNs, threshold=None, tables=None):
+    """Pool initializer: keep the stacked PFMs in the worker process."""
+    worker_state["PFM_groups"] = PFM_groups
+    worker_state["n_PFMs"] = n_PFMs
+    worker_state["topNs"] = topNs
+    worker_state["threshold"] = threshold
+    worker_state["tables"] = tables
+
+
+def score_chunk(task):
+    """
+    Pool task: score the sequences with the given offsets in a code file.
+    The codes are memory mapped so they are never copied to the worker.
+    """
+    codes_file, offsets = task
+    codes = np.memmap(codes_file, dtype=np.uint8, mode="r")
+    if worker_state["threshold"] is not None:
+        return hits_codes(codes, offsets, worker_state["PFM_groups"], worker_state["threshold"])
+    return score_codes(
+        codes,
+        offsets,
+        worker_state["PFM_groups"],
+        worker_state["n_PFMs"],
+        worker_state["topNs"],
+        worker_state["tables"],
+    )
+
+
+def read_fasta_batches(fasta, batch_residues=BATCH_RESIDUES):
+    """
+    Yield (sequence IDs, sequences) from a two-line-per-record fasta in
+    batches holding roughly batch_residues letters.
+    """
+    seq_ids = []
+    sequences = []
+    residues = 0
+    with open(fasta) as f:
+        for line in f:
+            seq_ids.append(line.strip()[1:])
+            sequences.append(next(f).strip())
+            residues += len(sequences[-1])
+            if residues >= batch_residues:
+                yield seq_ids, sequences
+                seq_ids = []
+                sequences = []
+                residues = 0
+    if seq_ids:
+        yield seq_ids, sequences
+
+
+def read_PFMs(prefix):
+    """
+    Read all PFM files starting with prefix (which may include a directory).
+    Returns the PFM names (file names without extension) and a dict of log-PFMs.
+    """
+    PFMdir = "/".join(prefix.split("/")[:-1])
+    if PFMdir == "":
+        PFMdir = "."
+    PFMprefix = prefix.split("/")[-1]
+
+    if not os.path.exists(PFMdir):
+        raise IOError(f"PFM directory '{PFMdir}' not found")
+
+    PFMs = dict()
+    PFM_names = []
+    for p in os.listdir(PFMdir):
+        if p.startswith(PFMprefix):
+            PFM_name = ".".join(p.split(".")[:-1])
+            try:
+                PFMs[PFM_name] = log_PFM(read_PFM(PFMdir + "/" + p))
+            except (IOError, ValueError) as e:
+                raise IOError(f"Error reading PFM file '{p}': {e}")
+            PFM_names.append(PFM_name)
+    return PFM_names, PFMs
+
+
+def read_annotation_batches(filename, column, batch_residues=BATCH_RESIDUES):
+    """
+    Yield (sequence IDs, sequences) from one alphabet column of a
+    *_alphabet_annotations.tab file in batches holding roughly batch_residues
+    letters.
+    """
+    seq_ids = []
+    sequences = []
+    residues = 0
+    with open(filename) as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            seq_ids.append(fields[0])
+            sequences.append(fields[column])
+            residues += len(sequences[-1])
+            if residues >= batch_residues:
+                yield seq_ids, sequences
+                seq_ids = []
+                sequences = []
+                residues = 0
+    if seq_ids:
+        yield seq_ids, sequences
+
+
+def output_prefix(filename):
+    """Name used for the output of a fasta (*.fa, *.fasta), annotation table or store."""
+    name = filename.rstrip("/").split("/")[-1]
+    if name.endswith("_store"):
+        return name[: -len("_store")]
+    if name.endswith("_alphabet_annotations.tab"):
+        return name[: -len("_alphabet_annotations.tab")]
+    # Assumes suffix is .fa or .fasta
+    if ".fasta" in name:
+        return name[:-6]
+    return name[:-3]
+
+
+def encoded_batches(batches, alph):
+    """Encode (sequence IDs, sequences) batches into (sequence IDs, codes, offsets)."""
+    for seq_ids, sequences in batches:
+        yield (seq_ids,) + encode_sequences(sequences, alph)
+
+
+def score_unique(codes, offsets, score, known, max_known=UNIQUE_PROBES):
+    """
+    Scores of a batch of encoded sequences, computing score(codes, offsets)
+    only once for each distinct sequence. known maps the codes (bytes) of
+    sequences scored in earlier batches to their scores and is extended with
+    the batch until it holds max_known sequences.
+    """
+    index = {}
+    rows = np.empty(len(offsets) - 1, dtype=np.int64)
+    for i in range(len(rows)):
+        rows[i] = index.setdefault(codes[offsets[i] : offsets[i + 1]].tobytes(), len(index))
+    if not index:
+        return score(codes, offsets)
+    new = [key for key in index if key not in known]
+    scored = {}
+    if new:
+        new_offsets = np.zeros(len(new) + 1, dtype=np.int64)
+        np.cumsum([len(key) for key in new], out=new_offsets[1:])
+        scored = dict(zip(new, score(np.frombuffer(b"".join(new), dtype=np.uint8), new_offsets)))
+        for key in new[: max(max_known - len(known), 0)]:
+            known[key] = scored[key]
+    return np.array([scored[key] if key in scored else known[key] for key in index])[rows]
+
+
+def scan_file(
+    batches,
+    PFM_names,
+    PFM_groups,
+    topNs,
+    outfilenames,
+    pool=None,
+    workers=1,
+    workdir=None,
+    binary=False,
+    tables=None,
+    unique=False,
+    double=False,
+):
+    """
+    Score all batches of encoded sequences (sequence IDs, codes, offsets) with
+    the stacked PFMs, and k-mer score tables if given (see kmer_tables), and
+    write a score table for each N of topNs to the matching file of
+    outfilenames. If a process pool is given, each batch is written to a code
+    file in workdir and split into chunks of similar total length (4 per
+    worker) that are scored by the pool. Rows are always written in input
+    order. If binary is set the scores are written as float32 feature
+    matrices instead (see feature_matrix.py), or float64 ones if double is
+    set, outfilenames should then end in .npy. If unique is set each distinct sequence is scored once (see
+    score_unique).
+    """
+    widths = np.zeros(len(PFM_names), dtype=np.int64)
+    for cols, logp in PFM_groups:
+        widths[cols] = len(logp)
+
+    def score(codes, offsets):
+        if pool is None:
+            return score_codes(codes, offsets, PFM_groups, len(PFM_names), topNs, tables)
+        codes_file = os.path.join(workdir, "codes.bin")
+        codes.tofile(codes_file)
+        tasks = [(codes_file, offsets[i : j + 1]) for i, j in chunk_bounds(offsets, 4 * workers)]
+        return np.concatenate(list(pool.imap(score_chunk, tasks)))
+
+    known = {}
+
+    def scored_batches():
+        for seq_ids, codes, offsets in batches:
+            if unique:
+                scores = score_unique(codes, offsets, score, known)
+            else:
+                scores = score(codes, offsets)
+            yield seq_ids, scores, np.diff(offsets)
+
+    if binary:
+        blocks = (
+            [np.where(lengths[:, None] < widths[None, :] + topN - 1, 0, scores[:, t]) for t, topN in enumerate(topNs)]
+            for seq_ids, scores, lengths in scored_batches()
+        )
+        write_matrices(outfilenames, blocks, PFM_names, np.float64 if double else np.float32)
+        return
+    outfiles = [open(outfilename, "w") for outfilename in outfilenames]
+    try:
+        for outfile in outfiles:
+            outfile.write("seq_id\t" + "\t".join(PFM_names) + "\n")
+        for seq_ids, scores, lengths in scored_batches():
+            for t, (topN, outfile) in enumerate(zip(topNs, outfiles)):
+                outfile.writelines(format_scores(seq_ids, scores[:, t], lengths, widths, topN))
+    finally:
+        for outfile in outfiles:
+            outfile.close()
+
+
+def scan_hits(batches, PFM_names, PFM_groups, threshold, outfilename, pool=None, workers=1, workdir=None):
+    """
+    Find the windows of all batches of encoded sequences scoring at least
+    threshold times the best possible score of a PFM (see hits_codes) and
+    write them as a table, in input order. The process pool is used as in
+    scan_file.
+    """
+    with open(outfilename, "w") as outfile:
+        outfile.write("seq_id\tPFM\tstart\tscore\n")
+        for seq_ids, codes, offsets in batches:
+            if pool is None:
+                seq, PFM, start, score = hits_codes(codes, offsets, PFM_groups, threshold)
+            else:
+                codes_file = os.path.join(workdir, "codes.bin")
+                codes.tofile(codes_file)
+                bounds = chunk_bounds(offsets, 4 * workers)
+                chunks = pool.imap(score_chunk, [(codes_file, offsets[i : j + 1]) for i, j in bounds])
+                hits = [(h[0] + i,) + h[1:] for (i, j), h in zip(bounds, chunks)]
+                seq, PFM, start, score = [np.concatenate(h) for h in zip(*hits)]
+            to_text = str if score.dtype == np.float64 else "{:.9g}".format
+            outfile.writelines(
+                seq_ids[k] + "\t" + PFM_names[p] + "\t" + str(b + 1) + "\t" + to_text(v) + "\n"
+                for k, p, b, v in zip(seq.tolist(), PFM.tolist(), start.tolist(), score.tolist())
+            )
+
+
 if __name__ == "__main__":
+    from annotation_store import is_store, open_store, store_batches
+
     parser = ArgumentParser()
     parser.add_argument(
         "-a",
         "--alph",
-        help="Alphabet used in the PFMs. Can be: seq-4, seq-struct-8, "
+        help="Alphabet(s) used in the PFMs, comma separated. Can be: seq-4, seq-struct-8, "
         "seq-struct-16, seq-struct-28, struct-2, struct-4, struct-7",
     )
-    parser.add_argument("-f", "--fasta", help="Path to uncompressed fasta with sequences", type=str)
+    parser.add_argument(
+        "-f",
+        "--fasta",
+        help="Path(s) to uncompressed fasta with sequences or alphabet annotation tables, comma separated",
+        type=str,
+    )
     parser.add_argument("-p", "--prefix", type=str, help="Prefix of the PFM files")
     parser.add_argument(
         "-n",
         "--topN",
-        type=int,
-        help="Number of top subsequence scores to add for total sequence score",
+        type=str,
+        help="Number(s) of top subsequence scores to add for total sequence score, comma separated",
+    )
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        help="Report windows scoring at least this fraction of the best possible PFM score instead of top N sums",
     )
+    parser.add_argument("-o", "--outdir", type=str, default=".", help="Directory to write output files to")
+    parser.add_argument(
+        "-H", "--header", type=str, help="annotation_alphabets_header.tab naming annotation table columns"
+    )
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Number of processes used for scoring")
+    parser.add_argument(
+        "-P", "--precision", choices=precisions, default="float64", help="Precision used to compute scores"
+    )
+    parser.add_argument(
+        "-b", "--binary", action="store_true", help="Write float32 .npy feature matrices instead of .tab tables"
+    )
+    parser.add_argument("-d", "--double", action="store_true", help="With -b, write float64 feature matrices")
+    parser.add_argument("-u", "--unique", action="store_true", help="Score each distinct sequence once")
 
     args = parser.parse_args()
 
     # Validate required arguments
-    if not args.alph or not args.fasta or not args.prefix or args.topN is None:
-        parser.error("All arguments (-a, -f, -p, -n) are required")
+    if not args.alph or not args.fasta or not args.prefix or (args.topN is None and args.threshold is None):
+        parser.error("All arguments (-a, -f, -p, -n or -t) are required")
 
-    if args.alph not in alphabets:
-        sys.stderr.write(f"Error: Invalid alphabet '{args.alph}'. " f"Valid options: {', '.join(alphabets.keys())}\n")
-        sys.exit(1)
+    alphs = args.alph.split(",")
+    for alph in alphs:
+        if alph not in alphabets:
+            sys.stderr.write(f"Error: Invalid alphabet '{alph}'. " f"Valid options: {', '.join(alphabets.keys())}\n")
+            sys.exit(1)
 
-    if not os.path.exists(args.fasta):
-        sys.stderr.write(f"Error: Fasta file '{args.fasta}' not found\n")
-        sys.exit(1)
+    files = dict()
+    for alph in alphs:
+        files[alph] = [f.replace("{alph}", alph) for f in args.fasta.split(",")]
+        for f in files[alph]:
+            if not os.path.exists(f):
+                sys.stderr.write(f"Error: Fasta file '{f}' not found\n")
+                sys.exit(1)
 
-    if args.topN <= 0:
-        sys.stderr.write("Error: topN must be greater than 0\n")
+    if args.double and not args.binary:
+        sys.stderr.write("Error: -d can only be used with -b\n")
         sys.exit(1)
 
-    # Assumes suffix is .fa or .fasta
-    if ".fasta" in args.fasta:
-        out_prefix = args.fasta[:-6]
+    topNs = None
+    if args.threshold is not None:
+        if not 0 < args.threshold <= 1:
+            sys.stderr.write("Error: threshold must be greater than 0 and at most 1\n")
+            sys.exit(1)
+        for flag, used in [("-b", args.binary), ("-u", args.unique)]:
+            if used:
+                sys.stderr.write(f"Error: {flag} cannot be used with -t\n")
+                sys.exit(1)
     else:
-        out_prefix = args.fasta[:-3]
-    # Remove path
-    out_prefix = out_prefix.split("/")[-1]
+        try:
+            topNs = sorted(set(int(n) for n in args.topN.split(",")))
+        except ValueError:
+            sys.stderr.write(f"Error: -n must be a comma-separated list of positive integers, got '{args.topN}'\n")
+            sys.exit(1)
+        if topNs[0] <= 0:
+            sys.stderr.write("Error: topN must be greater than 0\n")
+            sys.exit(1)
 
-    # Read in PFMs
-    PFMdir = "/".join(args.prefix.split("/")[:-1])
-    if PFMdir == "":
-        PFMdir = "."
-    PFMprefix = args.prefix.split("/")[-1]
-
-    if not os.path.exists(PFMdir):
-        sys.stderr.write(f"Error: PFM directory '{PFMdir}' not found\n")
+    if args.workers <= 0:
+        sys.stderr.write("Error: workers must be greater than 0\n")
         sys.exit(1)
+    batch_residues = BATCH_RESIDUES * 4 * args.workers if args.workers > 1 else BATCH_RESIDUES
+    workdir = tempfile.TemporaryDirectory()
 
-    try:
-        PFM_dir_files = os.listdir(PFMdir)
-    except OSError as e:
-        sys.stderr.write(f"Error reading PFM directory: {e}\n")
-        sys.exit(1)
+    # Columns of alphabet annotation tables
+    columns = dict()
+    if any(f.endswith("_alphabet_annotations.tab") for f in args.fasta.split(",")):
+        if not args.header:
+            sys.stderr.write("Error: -H is required to scan alphabet annotation tables\n")
+            sys.exit(1)
+        try:
+            with open(args.header) as f:
+                columns = {a: i for i, a in enumerate(f.readline().strip().split("\t"))}
+        except IOError as e:
+            sys.stderr.write(f"Error reading header file: {e}\n")
+            sys.exit(1)
+        for alph in alphs:
+            if alph not in columns:
+                sys.stderr.write(f"Error: Alphabet '{alph}' is not a column of '{args.header}'\n")
+                sys.exit(1)
 
-    PFMs = dict()
-    PFM_names = []
-    for p in PFM_dir_files:
-        if p.startswith(PFMprefix):
-            PFM_name = ".".join(p.split(".")[:-1])
+    # Read each alphabet's PFMs once and scan every file with them
+    for alph in alphs:
+        prefix = args.prefix.replace("{alph}", alph)
+        try:
+            PFM_names, PFMs = read_PFMs(prefix)
+        except OSError as e:
+            sys.stderr.write(f"Error: {e}\n")
+            sys.exit(1)
+
+        if not PFM_names:
+            if len(alphs) > 1:
+                sys.stderr.write(f"No PFM files found for alphabet {alph}, skipping\n")
+                continue
+            PFMdir = "/".join(prefix.split("/")[:-1]) or "."
+            sys.stderr.write(f"Error: No PFM files found with prefix '{prefix.split('/')[-1]}' in '{PFMdir}'\n")
+            sys.exit(1)
+
+        # Score all PFMs of the same width together on batches of sequences
+        PFM_groups = stack_PFMs(PFM_names, PFMs, args.precision)
+        # Small alphabets and widths are scored by k-mer table lookup
+        tables = kmer_tables(PFM_groups) if args.threshold is None else None
+        outdir = args.outdir.replace("{alph}", alph)
+        pool = None
+        if args.workers > 1:
+            pool = Pool(
+                args.workers,
+                initializer=init_worker,
+                initargs=(PFM_groups, len(PFM_names), topNs, args.threshold, tables),
+            )
+        for f in files[alph]:
+            if is_store(f):
+                batches = store_batches(open_store(f), alph, batch_residues)
+            elif f.endswith("_alphabet_annotations.tab"):
+                batches = encoded_batches(read_annotation_batches(f, columns[alph], batch_residues), alph)
+            else:
+                batches = encoded_batches(read_fasta_batches(f, batch_residues), alph)
             try:
-                PFM_file = open(PFMdir + "/" + p, "r")
-                lines = PFM_file.readlines()
-                PFM_file.close()
-                PFM = []
-                for line in lines:
-                    PFM.append([float(i) for i in line.strip().split("\t")[1:]])
-                PFMs[PFM_name] = np.array(PFM).T
-                PFM_names.append(PFM_name)
-            except (IOError, ValueError) as e:
-                sys.stderr.write(f"Error reading PFM file '{p}': {e}\n")
+                if args.threshold is not None:
+                    outfilename = outdir + "/" + output_prefix(f) + "_PFM_scan_hits_" + str(args.threshold) + ".tab"
+                    scan_hits(
+                        batches, PFM_names, PFM_groups, args.threshold, outfilename, pool, args.workers, workdir.name
+                    )
+                    continue
+                outfilenames = [
+                    outdir
+                    + "/"
+                    + output_prefix(f)
+                    + "_PFM_scan_sum_top_"
+                    + str(topN)
+                    + (".npy" if args.binary else ".tab")
+                    for topN in topNs
+                ]
+                scan_file(
+                    batches,
+                    PFM_names,
+                    PFM_groups,
+                    topNs,
+                    outfilenames,
+                    pool,
+                    args.workers,
+                    workdir.name,
+                    args.binary,
+                    tables,
+                    args.unique,
+                    args.double,
+                )
+            except IOError as e:
+                sys.stderr.write(f"Error during file processing: {e}\n")
                 sys.exit(1)
+            except ValueError as e:
+                sys.stderr.write(f"Error scanning sequences in '{f}': {e}\n")
+                sys.exit(1)
+        if pool is not None:
+            pool.close()
+            pool.join()
 
-    if not PFM_names:
-        sys.stderr.write(f"Error: No PFM files found with prefix '{PFMprefix}' in '{PFMdir}'\n")
-        sys.exit(1)
-
-    try:
-        outfile = open(out_prefix + "_PFM_scan_sum_top_" + str(args.topN) + ".tab", "w")
-        outfile.write("seq_id\t" + "\t".join(PFM_names) + "\n")
-
-        with open(args.fasta) as f:
-            for line in f:
-                seq_id = line.strip()[1:]
-                sequence = next(f)
-                sequence = sequence.strip()
-                sequence_scores = []
-                for pn in PFM_names:
-                    p = PFMs[pn]
-                    if len(sequence) < len(p) + args.topN - 1:
-                        subseqscores = [0]
-                    else:
-                        subseqscores = []
-                        for i in range(1 + len(sequence) - len(p)):
-                            subseq = sequence[i : (i + len(p))]
-                            subseqscores.append(
-                                np.prod(
-                                    p[
-                                        range(len(p)),
-                                        [alphabets[args.alph][j] for j in subseq],
-                                    ]
-                                )
-                            )
-                    sequence_scores.append(sum(np.sort(subseqscores)[-args.topN :]))
-                outfile.write(seq_id + "\t" + "\t".join([str(i) for i in sequence_scores]) + "\n")
-
-        outfile.close()
-    except IOError as e:
-        sys.stderr.write(f"Error during file processing: {e}\n")
-        sys.exit(1)
+    workdir.cleanup()
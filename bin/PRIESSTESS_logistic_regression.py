@@ -3,6 +3,7 @@ import pickle
 import sys
 
 import numpy as np
+from feature_matrix import load_matrix
 from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import roc_auc_score
 from sklearn.model_selection import train_test_split
@@ -27,8 +28,9 @@ if not os.path.exists(trainfile):
 
 pred_loss = (100 - pred_loss) / 100
 
+# Feature matrices (*.npy) are memory mapped, *.tab files are parsed as text
 try:
-    trainset = np.loadtxt(trainfile, delimiter="\t", skiprows=1)
+    trainset, columns = load_matrix(trainfile)
 except (IOError, ValueError) as e:
     sys.stderr.write(f"Error reading training file '{trainfile}': {e}\n")
     sys.exit(1)
@@ -42,13 +44,7 @@ X = scaler.transform(X)
 
 Xtrain, Xtest, Ytrain, Ytest = train_test_split(X, Y, test_size=0.2, random_state=42)
 
-try:
-    afile = open(trainfile, "r")
-    alph = afile.readline().strip().split("\t")[1:]
-    afile.close()
-except IOError as e:
-    sys.stderr.write(f"Error reading alphabet from file: {e}\n")
-    sys.exit(1)
+alph = columns[1:]
 
 # PREPARE TO RUN LOGISTIC REGRESSION
 lr = LogisticRegression(solver="saga", penalty="l1", warm_start=True)
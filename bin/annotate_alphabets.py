@@ -1,5 +1,8 @@
 import os
 import sys
+from itertools import islice
+
+import numpy as np
 
 ####
 # This python script requires:
@@ -12,12 +15,27 @@ import sys
 
 # 2. A prefix for the output file
 
+# 3. Optionally, a comma separated list of the alphabets to write (Ex.
+# seq-4,struct-2). Default: all alphabets
+# If only seq-4 is requested the file may contain only the sequences, one per
+# line, and no folding is needed
+
+# 4. Optionally, -f5 <n> and -f3 <n>: the number of letters of the 5' and 3'
+# flanks to remove from every annotation (Default: 0), and -k to also write
+# the annotations with flanks to "prefix_alphabet_annotations_with_flanks.tab"
+
 # The script returns:
 
 # A tab-delimited file called "prefix_alphabet_annotations.tab"
-# Which contains a probe ID and each of the 7 alphabet annotations in the order
+# Which contains a probe ID and each of the 7 (or requested) alphabet
+# annotations in the order
 # probe_ID  seq-4  seq-struct-8  seq-struct-16  seq-struct-28  struct-2
 # struct-4  struct-7
+
+# The input is read in batches of lines so memory use does not depend on the
+# size of the file. Each position of a batch is converted to a combined
+# sequence/structure index and the five derived alphabets are read from one
+# lookup table indexed by it
 ####
 
 # Define conversion from sequence (4-letter) alphabet and 7-letter structure
@@ -51,87 +69,194 @@ struct_7_convert_4 = {"B": "M", "E": "U", "H": "L", "L": "P", "M": "M", "R": "P"
 # Converting 4-letter struct alphabet to 2-letter struct alphabet
 struct_4_convert_2 = {"P": "P", "L": "U", "U": "U", "M": "U"}
 
+# Alphabets in output column order, those derived from both the sequence and
+# the 7-letter structure annotation are in derived_letters order
+output_alphabets = ["seq-4", "seq-struct-8", "seq-struct-16", "seq-struct-28", "struct-2", "struct-4", "struct-7"]
+derived_alphabets = output_alphabets[1:6]
+
+# Number of input lines converted together
+BATCH_LINES = 100000
+
+# Byte value to index lookup tables for the sequence letters (ACGU) and the
+# 7-letter structure alphabet (BEHLMRT), -1 marks any other character
+seq_index = np.full(256, -1, dtype=np.int16)
+for k, c in enumerate("ACGU"):
+    seq_index[ord(c)] = k
+struct_index = np.full(256, -1, dtype=np.int16)
+for k, c in enumerate("BEHLMRT"):
+    struct_index[ord(c)] = k
+
+# Combined index (4-letter index * 7 + 7-letter index) to the letters of the
+# derived alphabets in output order: seq-struct-8, seq-struct-16,
+# seq-struct-28, struct-2, struct-4
+derived_letters = np.zeros((len(seq_struct_28_combos), 5), dtype=np.uint8)
+for k, combo in enumerate(seq_struct_28_combos):
+    letter_28 = combo2letter_seq_struct_28[combo]
+    struct_4 = struct_7_convert_4[combo[1]]
+    derived = [
+        seq_struct_28_convert_8[letter_28],
+        seq_struct_28_convert_16[letter_28],
+        letter_28,
+        struct_4_convert_2[struct_4],
+        struct_4,
+    ]
+    derived_letters[k] = [ord(c) for c in derived]
+
+
+def annotate_batch(seqs, structs, alphabets=output_alphabets):
+    """
+    Annotate the sequences and 7-letter structures of a batch with the
+    requested alphabets (in output_alphabets order); structs is None if only
+    seq-4 is requested. Returns, for each alphabet, one string holding the
+    annotations of all probes back to back, or raises KeyError naming the
+    first invalid character.
+    """
+    texts = {"seq-4": "".join(seqs)}
+    seq_codes = seq_index[np.frombuffer(texts["seq-4"].encode("ascii", "replace"), dtype=np.uint8)]
+    if structs is None:
+        if (seq_codes < 0).any():
+            raise KeyError(texts["seq-4"][int(np.argmax(seq_codes < 0))])
+        return [texts[a] for a in alphabets]
+
+    texts["struct-7"] = "".join(structs)
+    struct_codes = struct_index[np.frombuffer(texts["struct-7"].encode("ascii", "replace"), dtype=np.uint8)]
+    invalid = (seq_codes < 0) | (struct_codes < 0)
+    if invalid.any():
+        k = int(np.argmax(invalid))
+        raise KeyError(texts["seq-4"][k] if seq_codes[k] < 0 else texts["struct-7"][k])
+    derived = [k for k, a in enumerate(derived_alphabets) if a in alphabets]
+    if derived:
+        # All requested derived alphabets from one lookup of the combined index
+        letters = np.ascontiguousarray(derived_letters[:, derived][seq_codes * 7 + struct_codes].T)
+        for k, row in zip(derived, letters):
+            texts[derived_alphabets[k]] = row.tobytes().decode()
+    return [texts[a] for a in alphabets]
+
+
+def annotate_lines(lines, first_line, prefix, alphabets=output_alphabets, trims=((0, 0),)):
+    """
+    Convert a batch of input lines (the first being line first_line of the
+    file) to output lines holding the requested alphabets. If seq-4 is the
+    only alphabet requested, lines only need the sequence. Returns one list of
+    output lines for each (5' length, 3' length) pair of trims, with that many
+    letters removed from the ends of every annotation as by
+    cut -c | rev | cut -c | rev. Raises ValueError for malformed lines.
+    """
+    needs_structure = alphabets != ["seq-4"]
+    seqs = []
+    structs = []
+    for i, line in enumerate(lines, first_line):
+        parts = line.strip().split("\t")
+        if needs_structure:
+            if len(parts) < 3:
+                raise ValueError(f"Line {i} has fewer than 3 fields")
+            if len(parts[0]) != len(parts[2]):
+                raise ValueError(
+                    f"Line {i}: " f"sequence length ({len(parts[0])}) != structure length ({len(parts[2])})"
+                )
+            structs.append(parts[2])
+        seqs.append(parts[0])
+
+    texts = annotate_batch(seqs, structs if needs_structure else None, alphabets)
+    outs = [[] for _ in trims]
+    end = 0
+    for i, seq in enumerate(seqs, first_line):
+        start, end = end, end + len(seq)
+        name = prefix + "_" + str(i) + "\t"
+        for out, (flank5, flank3) in zip(outs, trims):
+            # Annotations shorter than the flanks are left empty
+            first = start + flank5
+            last = max(end - flank3, first)
+            out.append(name + "\t".join([t[first:last] for t in texts]) + "\n")
+    return outs
+
+
+def read_arguments(args):
+    """
+    Parse the optional arguments [alphabets] [-f5 <length>] [-f3 <length>]
+    [-k]. Returns (alphabets, 5' flank length, 3' flank length, keep flanks)
+    or raises ValueError.
+    """
+    alphabets = output_alphabets
+    flanks = {"-f5": 0, "-f3": 0}
+    keep_flanks = False
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg in flanks:
+            if not args or not args[0].isdigit():
+                raise ValueError(f"{arg} requires a flank length")
+            flanks[arg] = int(args.pop(0))
+        elif arg == "-k":
+            keep_flanks = True
+        elif arg.startswith("-") or alphabets is not output_alphabets:
+            raise ValueError(f"Unexpected argument '{arg}'")
+        else:
+            requested = arg.split(",")
+            for a in requested:
+                if a not in output_alphabets:
+                    raise ValueError(f"Invalid alphabet '{a}'. Valid options: {', '.join(output_alphabets)}")
+            alphabets = [a for a in output_alphabets if a in requested]
+    return alphabets, flanks["-f5"], flanks["-f3"], keep_flanks
+
+
 if __name__ == "__main__":
-    # Read in filename and prefix
+    # Read in filename, prefix and optionally the alphabets to write and the
+    # flanks to remove
     try:
         filename = sys.argv[1]
         prefix = sys.argv[2]
     except IndexError:
         sys.stderr.write("Error: Missing required arguments\n")
-        sys.stderr.write("Usage: annotate_alphabets.py <filename> <prefix>\n")
+        sys.stderr.write("Usage: annotate_alphabets.py <filename> <prefix> [alphabets] [-f5 <n>] [-f3 <n>] [-k]\n")
+        sys.exit(1)
+
+    try:
+        alphabets, flank5, flank3, keep_flanks = read_arguments(sys.argv[3:])
+    except ValueError as e:
+        sys.stderr.write(f"Error: {e}\n")
         sys.exit(1)
 
     if not os.path.exists(filename):
         sys.stderr.write(f"Error: Input file '{filename}' not found\n")
         sys.exit(1)
 
-    # Read all lines in file
     try:
         filein = open(filename, "r")
-        lines = filein.readlines()
-        filein.close()
     except IOError as e:
         sys.stderr.write(f"Error reading input file: {e}\n")
         sys.exit(1)
 
-    if not lines:
-        sys.stderr.write("Error: Input file is empty\n")
-        sys.exit(1)
-
-    # Open output file
+    # Open output files, flank free annotations first
+    outfilenames = [prefix + "_alphabet_annotations.tab"]
+    trims = [(flank5, flank3)]
+    if keep_flanks:
+        outfilenames.append(prefix + "_alphabet_annotations_with_flanks.tab")
+        trims.append((0, 0))
     try:
-        fileout = open(prefix + "_alphabet_annotations.tab", "w")
+        fileouts = [open(outfilename, "w") for outfilename in outfilenames]
     except IOError as e:
         sys.stderr.write(f"Error creating output file: {e}\n")
         sys.exit(1)
 
     try:
-        # For each line use the sequence and 7-letter alphabet
-        # To convert to all other alphabets
-        for i in range(len(lines)):
-            line_data = lines[i]
-            parts = line_data.strip().split("\t")
-            if len(parts) < 3:
-                sys.stderr.write(f"Error: Line {i + 1} has fewer than 3 fields\n")
-                sys.exit(1)
-
-            seq_4 = parts[0]
-            struct_7 = parts[2]
-
-            if len(seq_4) != len(struct_7):
-                sys.stderr.write(
-                    f"Error: Line {i + 1}: " f"sequence length ({len(seq_4)}) != structure length ({len(struct_7)})\n"
-                )
-                sys.exit(1)
-
-            N = range(len(struct_7))
-
-            seq_struct_28 = "".join([combo2letter_seq_struct_28[seq_4[i] + struct_7[i]] for i in N])
-            seq_struct_16 = "".join([seq_struct_28_convert_16[seq_struct_28[i]] for i in N])
-            seq_struct_8 = "".join([seq_struct_28_convert_8[seq_struct_28[i]] for i in N])
-            struct_4 = "".join([struct_7_convert_4[struct_7[i]] for i in N])
-            struct_2 = "".join([struct_4_convert_2[struct_4[i]] for i in N])
-
-            # Write all annotations to file + ID based on line number
-            fileout.write(
-                prefix
-                + "_"
-                + str(i + 1)
-                + "\t"
-                + "\t".join(
-                    [
-                        seq_4,
-                        seq_struct_8,
-                        seq_struct_16,
-                        seq_struct_28,
-                        struct_2,
-                        struct_4,
-                        struct_7,
-                    ]
-                )
-                + "\n"
-            )
+        # Convert batches of lines, using the sequence and 7-letter alphabet
+        # of each line to derive the requested alphabets
+        n_lines = 0
+        while True:
+            lines = list(islice(filein, BATCH_LINES))
+            if not lines:
+                break
+            for fileout, out in zip(fileouts, annotate_lines(lines, n_lines + 1, prefix, alphabets, trims)):
+                fileout.writelines(out)
+            n_lines += len(lines)
+        if n_lines == 0:
+            sys.stderr.write("Error: Input file is empty\n")
+            sys.exit(1)
 
+    except ValueError as e:
+        sys.stderr.write(f"Error: {e}\n")
+        sys.exit(1)
     except KeyError as e:
         sys.stderr.write(f"Error: Invalid character in sequence or structure: {e}\n")
         sys.exit(1)
@@ -139,5 +264,7 @@ if __name__ == "__main__":
         sys.stderr.write(f"Error processing data: {e}\n")
         sys.exit(1)
     finally:
-        # Close output file
-        fileout.close()
+        # Close input and output files
+        filein.close()
+        for fileout in fileouts:
+            fileout.close()
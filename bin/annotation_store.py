@@ -0,0 +1,292 @@
+"""
+Integer-encoded, memory-mappable store of alphabet annotations.
+
+A store is built once from a *_alphabet_annotations.tab file and holds, in a
+directory:
+    store.json      alphabets, bits per letter and number of probes/letters
+    ids.npy         probe IDs (fixed width bytes)
+    offsets.npy     int64 letter offsets, probe i is letters
+                    offsets[i]:offsets[i + 1] of every alphabet
+    <alphabet>.npy  uint8 alphabet indices (as in PFM_scan.py), bit-packed
+                    1, 2 or 4 bits per letter when the alphabet allows
+All arrays are opened with np.load(mmap_mode="r") so reading a store never
+loads more than the requested probes into memory.
+
+USAGE:
+    annotation_store.py build <annotations.tab> <header.tab> <store_dir>
+    annotation_store.py fasta <store_dir> <alphabet> [-l <line_numbers>]
+    annotation_store.py split <store_dir> <prefix> -s <set>:<n>[,<set>:<n>...]
+
+  build  Build a store from an annotation table whose columns are named by
+         the first line of header.tab (annotation_alphabets_header.tab)
+  fasta  Write the probes of one alphabet to stdout as a fasta, optionally
+         only the probes on the (1-based) lines listed in line_numbers
+  split  Write the probes of every alphabet of a store to the fasta files
+         <alphabet>/<prefix>_<set>.fa in one pass over the store, the sets
+         taking consecutive probes from the first, Ex:
+         annotation_store.py split fg_store fg -s STREME:500,LR:250,test:250
+"""
+
+import json
+import os
+import shutil
+import sys
+from argparse import ArgumentParser
+
+import numpy as np
+from PFM_scan import BATCH_RESIDUES, alphabets, encode_sequence
+
+# Number of annotation lines encoded together when building a store
+BUILD_LINES = 100000
+
+
+def bits_per_letter(alph):
+    """Smallest of 1, 2, 4 or 8 bits that can hold every letter of the alphabet."""
+    for bits in [1, 2, 4]:
+        if len(alphabets[alph]) <= 2**bits:
+            return bits
+    return 8
+
+
+def pack_codes(codes, bits):
+    """Pack alphabet indices into bytes, first letter in the lowest bits."""
+    if bits == 8:
+        return codes
+    per_byte = 8 // bits
+    padded = np.zeros(-(-len(codes) // per_byte) * per_byte, dtype=np.uint8)
+    padded[: len(codes)] = codes
+    padded = padded.reshape(-1, per_byte) << (bits * np.arange(per_byte, dtype=np.uint8))
+    return np.bitwise_or.reduce(padded, axis=1).astype(np.uint8)
+
+
+def unpack_codes(packed, bits, start, end):
+    """Alphabet indices of letters start:end from a packed code array."""
+    if bits == 8:
+        return np.asarray(packed[start:end])
+    per_byte = 8 // bits
+    first = start // per_byte
+    chunk = np.asarray(packed[first : -(-end // per_byte)])
+    codes = (chunk[:, None] >> (bits * np.arange(per_byte, dtype=np.uint8))) & ((1 << bits) - 1)
+    return codes.ravel()[start - first * per_byte : end - first * per_byte]
+
+
+def build_store(annotation_file, columns, store_dir):
+    """
+    Build a store from an annotation table. columns maps each alphabet to its
+    column in the table (column 0 holds the probe IDs).
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    bits = {alph: bits_per_letter(alph) for alph in columns}
+    outfiles = {alph: open(os.path.join(store_dir, alph + ".codes"), "wb") for alph in columns}
+    # Letters left over after packing a batch are carried to the next one
+    carry = {alph: np.zeros(0, dtype=np.uint8) for alph in columns}
+    ids = []
+    lengths = []
+
+    def write_batch(lines):
+        fields = [line.rstrip("\n").split("\t") for line in lines]
+        ids.extend([f[0] for f in fields])
+        lengths.extend([len(f[1]) for f in fields])
+        for alph, c in columns.items():
+            sequences = [f[c] for f in fields]
+            if [len(s) for s in sequences] != lengths[-len(fields) :]:
+                raise ValueError(f"Annotations of alphabet {alph} differ in length from the first alphabet")
+            codes = np.concatenate([carry[alph], encode_sequence("".join(sequences), alph)])
+            per_byte = 8 // bits[alph]
+            n = len(codes) - len(codes) % per_byte
+            outfiles[alph].write(pack_codes(codes[:n], bits[alph]).tobytes())
+            carry[alph] = codes[n:]
+
+    try:
+        with open(annotation_file) as f:
+            lines = []
+            for line in f:
+                lines.append(line)
+                if len(lines) == BUILD_LINES:
+                    write_batch(lines)
+                    lines = []
+            if lines:
+                write_batch(lines)
+        for alph in columns:
+            outfiles[alph].write(pack_codes(carry[alph], bits[alph]).tobytes())
+    finally:
+        for outfile in outfiles.values():
+            outfile.close()
+
+    # Convert raw code files to .npy so they can be memory mapped, copying
+    # the packed codes after the header without loading them
+    header = {"descr": np.lib.format.dtype_to_descr(np.dtype(np.uint8)), "fortran_order": False}
+    for alph in columns:
+        raw = os.path.join(store_dir, alph + ".codes")
+        header["shape"] = (os.path.getsize(raw),)
+        with open(os.path.join(store_dir, alph + ".npy"), "wb") as f, open(raw, "rb") as r:
+            np.lib.format.write_array_header_1_0(f, header)
+            shutil.copyfileobj(r, f)
+        os.remove(raw)
+
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    np.save(os.path.join(store_dir, "offsets.npy"), offsets)
+    np.save(os.path.join(store_dir, "ids.npy"), np.array(ids, dtype=bytes))
+    with open(os.path.join(store_dir, "store.json"), "w") as f:
+        json.dump({"alphabets": bits, "probes": len(ids), "letters": int(offsets[-1])}, f, indent=1)
+
+
+def is_store(path):
+    """True if path is a store directory."""
+    return os.path.isfile(os.path.join(path, "store.json"))
+
+
+def open_store(store_dir):
+    """Open a store; all arrays are memory mapped."""
+    with open(os.path.join(store_dir, "store.json")) as f:
+        store = json.load(f)
+    store["ids"] = np.load(os.path.join(store_dir, "ids.npy"), mmap_mode="r")
+    store["offsets"] = np.load(os.path.join(store_dir, "offsets.npy"), mmap_mode="r")
+    store["codes"] = {
+        alph: np.load(os.path.join(store_dir, alph + ".npy"), mmap_mode="r") for alph in store["alphabets"]
+    }
+    return store
+
+
+def store_batches(store, alph, batch_residues=BATCH_RESIDUES, probes=None):
+    """
+    Yield (probe IDs, codes, offsets) for one alphabet in batches holding
+    roughly batch_residues letters, in the form returned by
+    PFM_scan.encode_sequences. probes is an optional sorted array of probe
+    indices to read instead of all probes.
+    """
+    if alph not in store["alphabets"]:
+        raise ValueError(f"Alphabet {alph} is not in the store")
+    bits = store["alphabets"][alph]
+    offsets = store["offsets"]
+    if probes is None:
+        probes = np.arange(store["probes"])
+    probes = np.asarray(probes, dtype=np.int64)
+    lengths = offsets[probes + 1] - offsets[probes]
+    ends = np.cumsum(lengths)
+    first = 0
+    while first < len(probes):
+        last = max(int(np.searchsorted(ends, ends[first] - lengths[first] + batch_residues)), first + 1)
+        last = min(last, len(probes))
+        batch = probes[first:last]
+        runs = np.flatnonzero(np.diff(batch) != 1) + 1
+        codes = np.concatenate(
+            [unpack_codes(store["codes"][alph], bits, offsets[r[0]], offsets[r[-1] + 1]) for r in np.split(batch, runs)]
+        )
+        batch_offsets = np.zeros(len(batch) + 1, dtype=np.int64)
+        np.cumsum(lengths[first:last], out=batch_offsets[1:])
+        yield [i.decode() for i in store["ids"][batch]], codes, batch_offsets
+        first = last
+
+
+def fasta_records(alph, seq_ids, codes, offsets):
+    """Two-line fasta records of a batch of probes of one alphabet."""
+    text = np.frombuffer("".join(alphabets[alph]).encode(), dtype=np.uint8)[codes].tobytes().decode()
+    return [">" + seq_id + "\n" + text[offsets[i] : offsets[i + 1]] + "\n" for i, seq_id in enumerate(seq_ids)]
+
+
+def write_fasta(store, alph, outfile, probes=None):
+    """Write probes of one alphabet as a two-line-per-record fasta."""
+    for batch in store_batches(store, alph, probes=probes):
+        outfile.writelines(fasta_records(alph, *batch))
+
+
+def write_split(store, prefix, sets):
+    """
+    Write the probes of every alphabet as <alph>/<prefix>_<set>.fa. sets is a
+    list of (set name, number of probes), taking consecutive probes from the
+    first. The batches of all alphabets cover the same probes, so the store
+    is read once.
+    """
+    bounds = np.cumsum([0] + [n for _, n in sets])
+    if bounds[-1] > store["probes"]:
+        raise ValueError(f"The sets hold {bounds[-1]} probes, the store only {store['probes']}")
+    alphs = list(store["alphabets"])
+    outfiles = {
+        (alph, name): open(os.path.join(alph, f"{prefix}_{name}.fa"), "w") for alph in alphs for name, _ in sets
+    }
+    try:
+        first = 0
+        probes = np.arange(bounds[-1])
+        for batches in zip(*(store_batches(store, alph, probes=probes) for alph in alphs)):
+            n = len(batches[0][0])
+            for alph, batch in zip(alphs, batches):
+                records = fasta_records(alph, *batch)
+                for k, (name, _) in enumerate(sets):
+                    start = min(max(bounds[k] - first, 0), n)
+                    end = min(max(bounds[k + 1] - first, 0), n)
+                    outfiles[alph, name].writelines(records[start:end])
+            first += n
+    finally:
+        for outfile in outfiles.values():
+            outfile.close()
+
+
+def main():
+    parser = ArgumentParser(description="Build or read an integer-encoded annotation store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Build a store from an alphabet annotation table")
+    build.add_argument("annotations", help="*_alphabet_annotations.tab file")
+    build.add_argument("header", help="annotation_alphabets_header.tab naming the table columns")
+    build.add_argument("store", help="Store directory to create")
+    fasta = subparsers.add_parser("fasta", help="Write one alphabet of a store as a fasta to stdout")
+    fasta.add_argument("store", help="Store directory")
+    fasta.add_argument("alph", help="Alphabet to write")
+    fasta.add_argument("-l", "--lines", help="File of 1-based line numbers of the probes to write")
+    split = subparsers.add_parser("split", help="Write the sets of probes of every alphabet of a store as fastas")
+    split.add_argument("store", help="Store directory")
+    split.add_argument("prefix", help="Prefix of the fasta files (Ex. fg)")
+    split.add_argument("-s", "--sets", required=True, help="Comma separated set:probes, Ex. STREME:500,LR:250")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        for filename in [args.annotations, args.header]:
+            if not os.path.exists(filename):
+                sys.stderr.write(f"Error: File '{filename}' not found\n")
+                sys.exit(1)
+        with open(args.header) as f:
+            names = f.readline().strip().split("\t")
+        columns = {alph: i for i, alph in enumerate(names) if alph in alphabets}
+        try:
+            build_store(args.annotations, columns, args.store)
+        except (IOError, ValueError, IndexError) as e:
+            sys.stderr.write(f"Error building store: {e}\n")
+            sys.exit(1)
+    elif args.command == "split":
+        if not is_store(args.store):
+            sys.stderr.write(f"Error: '{args.store}' is not an annotation store\n")
+            sys.exit(1)
+        try:
+            sets = [(name, int(n)) for name, n in (s.split(":") for s in args.sets.split(","))]
+        except ValueError:
+            parser.error("-s must list set:probes pairs, Ex. STREME:500,LR:250")
+        try:
+            write_split(open_store(args.store), args.prefix, sets)
+        except (IOError, ValueError) as e:
+            sys.stderr.write(f"Error: {e}\n")
+            sys.exit(1)
+    else:
+        if not is_store(args.store):
+            sys.stderr.write(f"Error: '{args.store}' is not an annotation store\n")
+            sys.exit(1)
+        store = open_store(args.store)
+        probes = None
+        if args.lines:
+            try:
+                probes = np.sort(np.loadtxt(args.lines, dtype=np.int64, ndmin=1)) - 1
+            except (IOError, ValueError) as e:
+                sys.stderr.write(f"Error reading line numbers: {e}\n")
+                sys.exit(1)
+            if len(probes) and (probes[0] < 0 or probes[-1] >= store["probes"]):
+                sys.stderr.write("Error: Line numbers must be between 1 and the number of probes\n")
+                sys.exit(1)
+        try:
+            write_fasta(store, args.alph, sys.stdout, probes)
+        except ValueError as e:
+            sys.stderr.write(f"Error: {e}\n")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
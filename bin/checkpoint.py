@@ -0,0 +1,85 @@
+"""
+Stage checkpoints of a PRIESSTESS run, used by PRIESSTESS -resume.
+
+Each stage of a run has a key: a hash of the keys of the stages it depends
+on, its parameters and, for the first stage, the contents of the input
+files. When a stage completes its key is saved in <checkpoints>/<stage>.done.
+With -resume a stage is skipped if its saved key matches the current one,
+so changing a parameter or an input redoes that stage and every stage that
+depends on it.
+
+USAGE:
+    checkpoint.py key <value> [<value> ...] [-f <file> ...]
+    checkpoint.py done <checkpoints> <stage> <key>
+    checkpoint.py mark <checkpoints> <stage> <key>
+
+  key   Write the key of the values and file contents to stdout
+  done  Exit with status 0 if the stage completed with this key, else 1
+  mark  Record that the stage completed with this key
+"""
+
+import hashlib
+import os
+import sys
+from argparse import ArgumentParser
+
+# Bytes of a file hashed at a time
+HASH_BLOCK = 1 << 20
+
+
+def stage_key(values, filenames=()):
+    """Hash of parameter values and the contents of files."""
+    key = hashlib.sha256()
+    for value in values:
+        key.update(value.encode() + b"\0")
+    for filename in filenames:
+        with open(filename, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK), b""):
+                key.update(block)
+        key.update(b"\0")
+    return key.hexdigest()
+
+
+def stage_done(checkpoints, stage, key):
+    """True if the stage completed with this key."""
+    try:
+        with open(os.path.join(checkpoints, stage + ".done")) as f:
+            return f.read().strip() == key
+    except IOError:
+        return False
+
+
+def mark_done(checkpoints, stage, key):
+    """Record that the stage completed with this key."""
+    os.makedirs(checkpoints, exist_ok=True)
+    with open(os.path.join(checkpoints, stage + ".done"), "w") as f:
+        f.write(key + "\n")
+
+
+def main():
+    parser = ArgumentParser(description="Stage checkpoints of a PRIESSTESS run")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    key = subparsers.add_parser("key", help="Write the key of values and file contents")
+    key.add_argument("values", nargs="*", help="Parameter values and keys of earlier stages")
+    key.add_argument("-f", "--files", nargs="+", default=[], help="Input files whose contents are hashed")
+    for command in ["done", "mark"]:
+        stage = subparsers.add_parser(command, help=f"{command.capitalize()} a stage")
+        stage.add_argument("checkpoints", help="Checkpoint directory")
+        stage.add_argument("stage", help="Stage name")
+        stage.add_argument("key", help="Stage key")
+    args = parser.parse_args()
+
+    if args.command == "key":
+        try:
+            print(stage_key(args.values, args.files))
+        except IOError as e:
+            sys.stderr.write(f"Error reading input file: {e}\n")
+            sys.exit(1)
+    elif args.command == "done":
+        sys.exit(0 if stage_done(args.checkpoints, args.stage, args.key) else 1)
+    else:
+        mark_done(args.checkpoints, args.stage, args.key)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Binary feature matrices of PFM scores and assembly of training/test sets.
+
+A feature matrix is a float32 .npy file (rows x features), or float64 for
+reference scores (see precision_report.py), next to a sidecar file with the
+same name ending in .columns instead of .npy that holds one feature (column)
+name per line. PFM_scan.py -b writes a matrix for each scanned file; this
+script joins the matrices of several alphabets into one matrix with a leading
+class column (1 for fg rows, 0 for bg rows) without going through text. PRIESSTESS_logistic_regression.py and
+test_PRIESSTESS_model.py load matrices with np.load(mmap_mode="r") and still
+read tab separated tables.
+
+USAGE:
+    feature_matrix.py assemble -a <alphabets> -fg <fg_matrix> -bg <bg_matrix>
+                               -o <out.npy> [-t] [-r <max rank>] [-d]
+    feature_matrix.py tsv <matrix.npy>
+
+  assemble  Join the matrices of the comma separated alphabets. The text
+            {alph} in -fg and -bg is replaced by each alphabet name and
+            feature names are prefixed with the alphabet name, Ex:
+            feature_matrix.py assemble -a seq-4,struct-2
+                -fg {alph}/fg_LR_PFM_scan_sum_top_4.npy
+                -bg {alph}/bg_LR_PFM_scan_sum_top_4.npy -o LR_training_set.npy
+            With -t the assembled matrix is also exported to a tab separated
+            table with the same name ending in .tab
+            With -r only the scores of PFMs ranked up to the given rank
+            (columns PFM-1 to PFM-<rank>) are kept
+            With -d the assembled matrix is float64 instead of float32
+  tsv       Write a matrix as a tab separated table (header line of column
+            names) to stdout
+"""
+
+import os
+import shutil
+import sys
+from argparse import ArgumentParser
+
+import numpy as np
+
+# Number of rows copied or formatted at a time
+ROW_BLOCK = 65536
+
+
+def columns_file(filename):
+    """Sidecar file holding the column names of a matrix."""
+    return filename[:-4] + ".columns"
+
+
+def write_matrix(filename, blocks, columns, dtype=np.float32):
+    """
+    Write 2D blocks of rows, given as an iterable, as one float32 (or dtype)
+    matrix. Rows are streamed to a raw file first as the number of rows is
+    only known at the end.
+    """
+    write_matrices([filename], ([block] for block in blocks), columns, dtype)
+
+
+def write_matrices(filenames, blocks, columns, dtype=np.float32):
+    """
+    Write several float32 (or dtype) matrices with the same columns at once,
+    as write_matrix does. Each item of blocks is a list holding the next 2D
+    block of rows of each matrix.
+    """
+    raws = [open(filename + ".part", "wb") for filename in filenames]
+    rows = [0] * len(filenames)
+    try:
+        for matrix_blocks in blocks:
+            for k, block in enumerate(matrix_blocks):
+                block = np.asarray(block, dtype=dtype)
+                if block.shape[1] != len(columns):
+                    raise ValueError(f"Rows have {block.shape[1]} values for {len(columns)} columns")
+                block.tofile(raws[k])
+                rows[k] += len(block)
+    finally:
+        for raw in raws:
+            raw.close()
+    header = {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False}
+    for filename, n_rows in zip(filenames, rows):
+        header["shape"] = (n_rows, len(columns))
+        with open(filename, "wb") as f, open(filename + ".part", "rb") as r:
+            np.lib.format.write_array_header_1_0(f, header)
+            shutil.copyfileobj(r, f)
+        os.remove(filename + ".part")
+        with open(columns_file(filename), "w") as f:
+            f.write("".join(c + "\n" for c in columns))
+
+
+def load_matrix(filename):
+    """
+    Return (matrix, column names) of a feature matrix (.npy, memory mapped) or
+    of a tab separated table with a header line.
+    """
+    if filename.endswith(".npy"):
+        matrix = np.load(filename, mmap_mode="r")
+        with open(columns_file(filename)) as f:
+            columns = f.read().split("\n")[:-1]
+        if matrix.ndim != 2 or matrix.shape[1] != len(columns):
+            raise ValueError(f"Matrix shape {matrix.shape} does not match its {len(columns)} column names")
+        return matrix, columns
+    with open(filename) as f:
+        columns = f.readline().rstrip("\n").split("\t")
+    return np.loadtxt(filename, delimiter="\t", skiprows=1, ndmin=2), columns
+
+
+def PFM_rank(column):
+    """Rank of the PFM of a column named after its PFM file, Ex. PFM-12 -> 12."""
+    try:
+        return int(column.rsplit("-", 1)[1])
+    except (IndexError, ValueError):
+        raise ValueError(f"Column '{column}' is not named PFM-<rank>")
+
+
+def assemble(alphs, fg_template, bg_template, outfilename, max_rank=None, dtype=np.float32):
+    """
+    Join the fg and bg matrices of each alphabet column-wise and stack fg rows
+    above bg rows, with a leading class column, into a float32 (or dtype)
+    matrix. If max_rank is given only the columns of PFMs ranked up to
+    max_rank are kept.
+    """
+    parts = []
+    for alph in alphs:
+        fg, fg_columns = load_matrix(fg_template.replace("{alph}", alph))
+        bg, bg_columns = load_matrix(bg_template.replace("{alph}", alph))
+        if fg_columns != bg_columns:
+            raise ValueError(f"fg and bg matrices of alphabet {alph} have different columns")
+        if parts and (len(fg), len(bg)) != (len(parts[0][1]), len(parts[0][2])):
+            raise ValueError(f"Matrices of alphabet {alph} have a different number of rows than alphabet {alphs[0]}")
+        keep = [k for k, c in enumerate(fg_columns) if max_rank is None or PFM_rank(c) <= max_rank]
+        if len(keep) < len(fg_columns):
+            # Columns are selected block by block below so that the memory
+            # mapped matrices are never loaded whole
+            fg = SelectedColumns(fg, keep)
+            bg = SelectedColumns(bg, keep)
+        parts.append(([alph + "_" + fg_columns[k] for k in keep], fg, bg))
+
+    columns = ["class"] + [c for names, fg, bg in parts for c in names]
+    n_fg = len(parts[0][1])
+    n_bg = len(parts[0][2])
+    matrix = np.lib.format.open_memmap(outfilename, mode="w+", dtype=dtype, shape=(n_fg + n_bg, len(columns)))
+    matrix[:n_fg, 0] = 1
+    matrix[n_fg:, 0] = 0
+    col = 1
+    for names, fg, bg in parts:
+        for start in range(0, max(n_fg, n_bg), ROW_BLOCK):
+            matrix[start : min(start + ROW_BLOCK, n_fg), col : col + len(names)] = fg[start : start + ROW_BLOCK]
+            end = min(start + ROW_BLOCK, n_bg)
+            matrix[n_fg + start : n_fg + end, col : col + len(names)] = bg[start : start + ROW_BLOCK]
+        col += len(names)
+    matrix.flush()
+    del matrix
+    with open(columns_file(outfilename), "w") as f:
+        f.write("".join(c + "\n" for c in columns))
+
+
+class SelectedColumns:
+    """Rows of a matrix restricted to some of its columns, sliced block by block."""
+
+    def __init__(self, matrix, columns):
+        self.matrix = matrix
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def __getitem__(self, rows):
+        return self.matrix[rows][:, self.columns]
+
+
+def write_tsv(matrix, columns, outfile):
+    """Write a matrix as a tab separated table with a header line."""
+    # Enough digits for the values to read back exactly
+    fmt = "%.17g" if matrix.dtype == np.float64 else "%.9g"
+    outfile.write("\t".join(columns) + "\n")
+    for start in range(0, len(matrix), ROW_BLOCK):
+        np.savetxt(outfile, matrix[start : start + ROW_BLOCK], delimiter="\t", fmt=fmt)
+
+
+def main():
+    parser = ArgumentParser(description="Assemble or export binary feature matrices")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    assemble_parser = subparsers.add_parser("assemble", help="Join the fg and bg matrices of several alphabets")
+    assemble_parser.add_argument("-a", "--alph", required=True, help="Alphabets to join, comma separated")
+    assemble_parser.add_argument("-fg", "--fg", required=True, help="fg matrix, {alph} is replaced by the alphabet")
+    assemble_parser.add_argument("-bg", "--bg", required=True, help="bg matrix, {alph} is replaced by the alphabet")
+    assemble_parser.add_argument("-o", "--out", required=True, help="Assembled matrix (*.npy)")
+    assemble_parser.add_argument("-t", "--tsv", action="store_true", help="Also export the matrix to a *.tab table")
+    assemble_parser.add_argument("-r", "--max-rank", type=int, help="Keep only the PFMs ranked up to this rank")
+    assemble_parser.add_argument("-d", "--double", action="store_true", help="Write a float64 matrix")
+    tsv = subparsers.add_parser("tsv", help="Write a matrix as a tab separated table to stdout")
+    tsv.add_argument("matrix", help="Feature matrix (*.npy)")
+    args = parser.parse_args()
+
+    if args.command == "assemble":
+        if not args.out.endswith(".npy"):
+            sys.stderr.write("Error: Assembled matrix name must end in .npy\n")
+            sys.exit(1)
+        alphs = args.alph.split(",")
+        for alph in alphs:
+            for template in [args.fg, args.bg]:
+                filename = template.replace("{alph}", alph)
+                if not os.path.exists(filename):
+                    sys.stderr.write(f"Error: File '{filename}' not found\n")
+                    sys.exit(1)
+        try:
+            assemble(alphs, args.fg, args.bg, args.out, args.max_rank, np.float64 if args.double else np.float32)
+            if args.tsv:
+                with open(args.out[:-4] + ".tab", "w") as f:
+                    write_tsv(*load_matrix(args.out), f)
+        except (IOError, ValueError) as e:
+            sys.stderr.write(f"Error assembling feature matrix: {e}\n")
+            sys.exit(1)
+    else:
+        if not args.matrix.endswith(".npy") or not os.path.exists(args.matrix):
+            sys.stderr.write(f"Error: Matrix '{args.matrix}' not found\n")
+            sys.exit(1)
+        try:
+            write_tsv(*load_matrix(args.matrix), sys.stdout)
+        except (IOError, ValueError) as e:
+            sys.stderr.write(f"Error reading feature matrix: {e}\n")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
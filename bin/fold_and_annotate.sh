@@ -9,66 +9,104 @@ if [[ "$(uname -s)" == "Darwin" ]]; then
     GSED=gsed
     GGREP=ggrep
 else
-    GSED=$(sed)
-    GGREP=$(grep)
+    GSED=sed
+    GGREP=grep
 fi
 
-# This script takes a file of sequences, one per line, not a fasta!
-# The file must be uncompressed
-# RNAfold is used to get the centroid structure for each sequence
-# And a file is returned called: prefix_alphabet_annotations.tab
+# This script takes files of sequences, one per line, not a fasta!
+# The files must be uncompressed
+# The centroid structure of each sequence is computed by fold_probes.py,
+# which folds chunks of all files in parallel
+# And for each file a file is returned called: prefix_alphabet_annotations.tab
 
-# The script takes the name of a file and location of the Lib directory
-file=$1
+# The script takes comma separated lists of files and their prefixes (Ex.
+# fg_seqs.txt,bg_seqs.txt and fg,bg) and the location of the Lib directory
+# Optionally a comma separated list of alphabets limits the annotations
+# written to those alphabets (Ex. seq-struct-8,struct-2) and the lengths of
+# the 5' and 3' flanks are removed from the annotations after folding
+# The number of folding processes and the folding backend (rnafold, vienna
+# or stub, see fold_probes.py) can also be set, as well as a folding cache
+# (SQLite file, see fold_cache.py) and the maximum number of structures it
+# keeps (0 or empty for no limit), and TRUE to fold each distinct sequence
+# of all files only once
+files=$1
 libpath=$2
-prefix=$3
+prefixes=$3
 temp=$4
 clean=$5
+alphabets=${6:-}
+flank5=${7:-0}
+flank3=${8:-0}
+workers=${9:-1}
+backend=${10:-rnafold}
+cache=${11:-}
+cache_max=${12:-0}
+unique=${13:-FALSE}
 
-# A directory is created to temporarily hold all RNAfold output
-currdir=${prefix}_RNAfold
-mkdir "$currdir"
-
-cat "$file" >"${currdir}/${prefix}.tab"
-
-# Fold sequences, split file into chunks of 50,000 to avoid
-# overwhelming the system with the output RNAfold produces
-cd "$currdir"
-split -l 50000 "${prefix}.tab" x
-N=$(wc -l <"${prefix}.tab")
-counter=0
-echo "Folding $N $prefix probes"
-for x in x*; do
-    RNAfold -p -T "$temp" --noPS <"$x" >>"${prefix}_RNAfold_output.txt"
-    rm -rf ./*.ps 2>/dev/null || true
-    n=$(wc -l <"$x")
-    counter=$((counter + n))
-    echo "$counter probes of $N have been folded"
+for file in $(echo "$files" | tr ',' ' '); do
+    echo "Folding $(wc -l <"$file") probes from $file"
 done
-cd ..
-
-# Clean up folding files
-mv "${currdir}/${prefix}_RNAfold_output.txt" .
-rm -rf "$currdir"
-
-# Extract centroid structures
-$GSED -n '4~5p' "${prefix}_RNAfold_output.txt" | $GGREP -o "^[.)(]*" >"${prefix}_structures.tab"
-
-# Annotate dot bracket structures to 7-letter structural alphabet
-# And compile information into: prefix_centroid_struct_annotations.tab
-"${libpath}/utils/parse_secondary_structure_v2" "${prefix}_structures.tab" "${prefix}_annotated.tab"
-paste "$file" "${prefix}_structures.tab" "${prefix}_annotated.tab" >"${prefix}_centroid_struct_annotations.tab"
+fold_args=""
+if [[ -n $cache ]]; then
+    fold_args="-C $cache"
+    if [[ $cache_max -gt 0 ]]; then
+        fold_args="$fold_args -M $cache_max"
+    fi
+fi
+if [[ $unique == "TRUE" ]]; then
+    fold_args="$fold_args -u"
+fi
 
-# Remove redundant files
-rm -f "${prefix}_annotated.tab" "${prefix}_structures.tab" "${prefix}_RNAfold_output.txt"
+# Annotations with flanks are kept unless cleaning up
+keep_flanks=""
+if [[ $clean == "FALSE" ]]; then
+    keep_flanks="-k"
+fi
 
-# Generate annotation file containing all annotations for 7-letter alphabet
-# Also adds column of probe names in format ${prefix}_linenumber
-python "${libpath}/annotate_alphabets.py" "${prefix}_centroid_struct_annotations.tab" "$prefix"
+# fold_probes.py writes each sequence with its dot bracket structure and
+# 7-letter structural alphabet annotation to
+# prefix_centroid_struct_annotations.tab as chunks are folded
+# Unless it is kept (no cleaning up) that file is a named pipe read by
+# annotate_alphabets.py, so annotations are written as probes are folded
+# and no intermediate file grows with the number of probes
+centroid_files=""
+pids=""
+for prefix in $(echo "$prefixes" | tr ',' ' '); do
+    centroid_files="${centroid_files},${prefix}_centroid_struct_annotations.tab"
+    if [[ $clean == "TRUE" ]]; then
+        rm -f "${prefix}_centroid_struct_annotations.tab"
+        mkfifo "${prefix}_centroid_struct_annotations.tab"
+        # Generate annotation file containing the requested (default all)
+        # alphabet annotations derived from the 7-letter alphabet, without
+        # flanks
+        # Also adds column of probe names in format ${prefix}_linenumber
+        python "${libpath}/annotate_alphabets.py" "${prefix}_centroid_struct_annotations.tab" "$prefix" $alphabets -f5 "$flank5" -f3 "$flank3" &
+        pids="$pids $!"
+    fi
+done
+centroid_files=${centroid_files#,}
 
-# Clean up
-if [[ $clean == "TRUE" ]]; then
-    rm -f "${prefix}_centroid_struct_annotations.tab"
-else
-    gzip "${prefix}_centroid_struct_annotations.tab"
+# Fold all sequences, chunks of all files are scheduled together
+if ! python "${libpath}/fold_probes.py" -i "$files" -o "$centroid_files" -t "$temp" -j "$workers" -b "$backend" -s $fold_args; then
+    if [[ -n $pids ]]; then
+        kill $pids 2>/dev/null || true
+    fi
+    if [[ $clean == "TRUE" ]]; then
+        rm -f $(echo "$centroid_files" | tr ',' ' ')
+    fi
+    exit 1
 fi
+for pid in $pids; do
+    wait "$pid"
+done
+
+for prefix in $(echo "$prefixes" | tr ',' ' '); do
+    if [[ $clean == "TRUE" ]]; then
+        rm -f "${prefix}_centroid_struct_annotations.tab"
+    else
+        # Generate annotation files as above, keeping the annotations with
+        # flanks and the compressed centroid structure annotations
+        python "${libpath}/annotate_alphabets.py" "${prefix}_centroid_struct_annotations.tab" "$prefix" $alphabets -f5 "$flank5" -f3 "$flank3" $keep_flanks
+        gzip "${prefix}_centroid_struct_annotations.tab"
+    fi
+done
@@ -0,0 +1,89 @@
+"""
+On-disk cache of centroid structures, shared between runs of fold_probes.py.
+
+The cache is an SQLite database holding one row per folded sequence and
+folder, where the folder names the folding program and version and the
+temperature (Ex. "RNAfold 2.6.4 T=37"). Sequences are the full probes that
+were folded, flanks included, so different flanks never share entries.
+Each run of fold_probes.py gets a run number and every structure read or
+added is marked with it; when the cache holds more than a maximum number of
+structures the least recently used ones are removed.
+"""
+
+import sqlite3
+
+# Number of sequences looked up in one query
+LOOKUP_BATCH = 500
+
+
+def open_cache(filename, folder):
+    """
+    Open (creating if needed) a cache for one folder and start a new run.
+    Returns a dict holding the connection and the hit and miss counts.
+    """
+    conn = sqlite3.connect(filename, timeout=600)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS structures (folder TEXT, sequence TEXT, structure TEXT, used INTEGER, "
+        "PRIMARY KEY (folder, sequence)) WITHOUT ROWID"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS structures_used ON structures (used)")
+    conn.execute("CREATE TABLE IF NOT EXISTS runs (run INTEGER PRIMARY KEY)")
+    with conn:
+        run = conn.execute("INSERT INTO runs DEFAULT VALUES").lastrowid
+    return {"conn": conn, "folder": folder, "run": run, "hits": 0, "misses": 0}
+
+
+def lookup(cache, seqs):
+    """Cached structures of seqs, None for sequences that are not cached."""
+    found = {}
+    conn = cache["conn"]
+    unique = list(set(seqs))
+    with conn:
+        for start in range(0, len(unique), LOOKUP_BATCH):
+            batch = unique[start : start + LOOKUP_BATCH]
+            marks = ",".join("?" * len(batch))
+            args = [cache["folder"]] + batch
+            found.update(
+                conn.execute(
+                    f"SELECT sequence, structure FROM structures WHERE folder = ? AND sequence IN ({marks})", args
+                )
+            )
+            conn.execute(
+                f"UPDATE structures SET used = {cache['run']} WHERE folder = ? AND sequence IN ({marks})", args
+            )
+    structures = [found.get(s) for s in seqs]
+    n_hits = sum(s is not None for s in structures)
+    cache["hits"] += n_hits
+    cache["misses"] += len(seqs) - n_hits
+    return structures
+
+
+def add(cache, seqs, structures):
+    """Add folded sequences to the cache."""
+    with cache["conn"] as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO structures VALUES (?, ?, ?, ?)",
+            ((cache["folder"], seq, structure, cache["run"]) for seq, structure in zip(seqs, structures)),
+        )
+
+
+def evict(cache, max_structures):
+    """
+    Remove the least recently used structures (of any folder) until at most
+    max_structures remain. Returns the number removed.
+    """
+    with cache["conn"] as conn:
+        excess = conn.execute("SELECT COUNT(*) FROM structures").fetchone()[0] - max_structures
+        if excess <= 0:
+            return 0
+        conn.execute(
+            "DELETE FROM structures WHERE (folder, sequence) IN "
+            "(SELECT folder, sequence FROM structures ORDER BY used LIMIT ?)",
+            (excess,),
+        )
+    return excess
+
+
+def close_cache(cache):
+    """Close the connection of a cache."""
+    cache["conn"].close()
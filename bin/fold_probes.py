@@ -0,0 +1,338 @@
+"""
+Fold probe sequences in parallel and write the centroid secondary structure
+of each probe.
+
+The probes of one or more sequence files (one sequence per line, not a
+fasta) are split into chunks of roughly CHUNK_NUCLEOTIDES nucleotides, as
+folding time grows faster than the number of probes with probe length. The
+chunks of all files are folded by a pool of workers and the structures of
+each file are written in input order, one dot-bracket structure per line.
+
+Folding backends, each a function taking a list of sequences and a
+temperature and returning their centroid structures:
+    rnafold  RNAfold -p --noPS run on each chunk
+    vienna   ViennaRNA Python bindings (import RNA), giving the same
+             structures as RNAfold without starting a process per chunk
+    stub     Deterministic structures that do not need ViennaRNA, for
+             testing only: the outermost stem of complementary bases
+             closing a loop of at least 3 unpaired bases
+
+With -s the structures are annotated with the 7-letter structure alphabet
+(see parse_secondary_structure.py) as each chunk is written, and each output
+line holds the sequence, structure and annotation (the input of
+annotate_alphabets.py). Output files can be pipes, so no intermediate files
+are needed.
+
+Identical sequences of a chunk are folded once; with -u every distinct
+sequence of all files is folded once, which saves most of the folding time
+of libraries with many duplicate probes at the cost of holding the
+structures of all distinct sequences in memory.
+
+With -C the structures are looked up in and added to a folding cache (see
+fold_cache.py) keyed by the folded sequence, temperature and folding program
+version, and only sequences that are not cached are folded.
+
+USAGE:
+    fold_probes.py -i <seqs.txt>[,<seqs.txt>...] -o <structures.tab>[,...]
+                   [-t <temperature>] [-j <workers>] [-b <backend>]
+                   [-c <nucleotides per chunk>] [-u] [-s]
+                   [-C <cache.sqlite> [-M <max cached structures>]]
+"""
+
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+from argparse import ArgumentParser
+from collections import deque
+from multiprocessing import Pool
+
+from fold_cache import add, close_cache, evict, lookup, open_cache
+from parse_secondary_structure import annotate_structures
+
+# Number of nucleotides folded together by one worker
+CHUNK_NUCLEOTIDES = 500000
+
+# Base pairs allowed by the stub backend
+STUB_PAIRS = {("A", "U"), ("U", "A"), ("C", "G"), ("G", "C"), ("G", "U"), ("U", "G")}
+
+
+def fold_rnafold(seqs, temp):
+    """
+    Centroid structures from RNAfold -p, one 5 line record per sequence. The
+    output is read as it is produced and only the centroid lines are kept.
+    """
+    # RNAfold writes dot plots to the working directory, keep them out of the way
+    with tempfile.TemporaryDirectory() as workdir, open(os.path.join(workdir, "stderr"), "w+") as stderr:
+        process = subprocess.Popen(
+            ["RNAfold", "-p", "-T", f"{temp:g}", "--noPS"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+            text=True,
+            cwd=workdir,
+        )
+        # Sequences are written from a thread so RNAfold never blocks on a full output pipe
+        writer = threading.Thread(target=write_lines, args=(process.stdin, seqs))
+        writer.start()
+        # The centroid structure is the 4th line of each record
+        structures = [line.rstrip("\n").split(" ")[0] for k, line in enumerate(process.stdout) if k % 5 == 3]
+        writer.join()
+        if process.wait() != 0:
+            stderr.seek(0)
+            raise RuntimeError(f"RNAfold failed: {stderr.read().strip()}")
+    if len(structures) != len(seqs):
+        raise RuntimeError(f"RNAfold returned {len(structures)} structures for {len(seqs)} sequences")
+    return structures
+
+
+def write_lines(outfile, lines):
+    """Write lines to a pipe and close it."""
+    try:
+        outfile.writelines(line + "\n" for line in lines)
+        outfile.close()
+    except BrokenPipeError:
+        pass
+
+
+def fold_vienna(seqs, temp):
+    """Centroid structures from the ViennaRNA Python bindings."""
+    import RNA
+
+    md = RNA.md()
+    md.temperature = temp
+    structures = []
+    for seq in seqs:
+        fc = RNA.fold_compound(seq, md)
+        mfe = fc.mfe()[1]
+        fc.exp_params_rescale(mfe)
+        fc.pf()
+        structures.append(fc.centroid()[0])
+    return structures
+
+
+def fold_stub(seqs, temp):
+    """Deterministic structures for testing: pair bases inwards from both ends."""
+    structures = []
+    for seq in seqs:
+        structure = ["."] * len(seq)
+        i, j = 0, len(seq) - 1
+        while j - i > 3 and (seq[i], seq[j]) in STUB_PAIRS:
+            structure[i], structure[j] = "(", ")"
+            i, j = i + 1, j - 1
+        structures.append("".join(structure))
+    return structures
+
+
+backends = {"rnafold": fold_rnafold, "vienna": fold_vienna, "stub": fold_stub}
+
+
+def backend_available(backend):
+    """True if the programs or modules a backend needs can be found."""
+    if backend == "rnafold":
+        return shutil.which("RNAfold") is not None
+    if backend == "vienna":
+        try:
+            import RNA  # noqa: F401
+        except ImportError:
+            return False
+    return True
+
+
+def backend_version(backend):
+    """Name and version of the folding program of a backend, used to key cached structures."""
+    if backend == "rnafold":
+        return subprocess.run(["RNAfold", "--version"], capture_output=True, text=True).stdout.strip()
+    if backend == "vienna":
+        import RNA
+
+        return "ViennaRNA " + RNA.__version__
+    return "stub"
+
+
+def read_chunks(filenames, chunk_nucleotides=CHUNK_NUCLEOTIDES):
+    """
+    Yield (file index, sequences) chunks of all files in order, each holding
+    at least chunk_nucleotides nucleotides unless it ends a file.
+    """
+    for k, filename in enumerate(filenames):
+        seqs = []
+        nucleotides = 0
+        with open(filename) as f:
+            for line in f:
+                seqs.append(line.strip())
+                nucleotides += len(seqs[-1])
+                if nucleotides >= chunk_nucleotides:
+                    yield k, seqs
+                    seqs = []
+                    nucleotides = 0
+        if seqs:
+            yield k, seqs
+
+
+def fold_chunk(args):
+    """Fold one chunk; args is (backend, temperature, file index, sequences)."""
+    backend, temp, k, seqs = args
+    return k, backends[backend](seqs, temp) if seqs else []
+
+
+def ordered_results(pool, tasks, pending):
+    """Results of fold_chunk on tasks in task order, keeping up to pending tasks queued."""
+    queue = deque()
+    for task in tasks:
+        queue.append(pool.apply_async(fold_chunk, (task,)))
+        if len(queue) >= pending:
+            yield queue.popleft().get()
+    while queue:
+        yield queue.popleft().get()
+
+
+def fold_files(
+    filenames,
+    outfilenames,
+    temp=37,
+    workers=1,
+    backend="rnafold",
+    chunk_nucleotides=CHUNK_NUCLEOTIDES,
+    cache=None,
+    unique=False,
+    annotate=False,
+):
+    """
+    Fold the sequences of all files and write their structures to the
+    corresponding output files in input order. With several workers at most
+    2 chunks per worker are pending at a time. If a cache (see
+    fold_cache.open_cache) is given only sequences missing from it are
+    folded and then added to it. Identical sequences of a chunk are folded
+    once, or of all files if unique is set.
+    """
+    totals = [0] * len(filenames)
+    for k, filename in enumerate(filenames):
+        with open(filename) as f:
+            totals[k] = sum(1 for _ in f)
+    # Structures by sequence (None while being folded), shared by all chunks
+    # if unique is set
+    run_structures = {}
+    # Sequences, sequences to fold and structures of chunks waiting to be folded, in order
+    pending = deque()
+
+    def tasks():
+        for k, seqs in read_chunks(filenames, chunk_nucleotides):
+            structures = run_structures if unique else {}
+            new = [s for s in dict.fromkeys(seqs) if s not in structures]
+            cached = lookup(cache, new) if cache is not None else [None] * len(new)
+            structures.update(zip(new, cached))
+            new = [s for s, c in zip(new, cached) if c is None]
+            pending.append((seqs, new, structures))
+            yield backend, temp, k, new
+
+    outfiles = [open(outfilename, "w") for outfilename in outfilenames]
+    folded = [0] * len(filenames)
+    n_folded = 0
+    pool = Pool(workers) if workers > 1 else None
+    try:
+        if pool is None:
+            results = map(fold_chunk, tasks())
+        else:
+            results = ordered_results(pool, tasks(), 2 * workers)
+        for k, new_structures in results:
+            seqs, new, structures = pending.popleft()
+            structures.update(zip(new, new_structures))
+            if cache is not None and new:
+                add(cache, new, new_structures)
+            chunk_structures = [structures[s] for s in seqs]
+            if not annotate:
+                outfiles[k].writelines(s + "\n" for s in chunk_structures)
+            else:
+                annotations = annotate_structures(chunk_structures)
+                outfiles[k].writelines(
+                    seq + "\t" + structure + "\t" + annotation + "\n"
+                    for seq, structure, annotation in zip(seqs, chunk_structures, annotations)
+                )
+            folded[k] += len(seqs)
+            n_folded += len(new)
+            print(f"{folded[k]} probes of {totals[k]} from {filenames[k]} have been folded", flush=True)
+        print(f"Folded {n_folded} sequences for {sum(folded)} probes")
+    finally:
+        if pool is not None:
+            pool.terminate()
+        for outfile in outfiles:
+            outfile.close()
+
+
+def main():
+    parser = ArgumentParser(description="Fold probe sequences in parallel and write their centroid structures")
+    parser.add_argument("-i", "--input", required=True, help="Sequence files, one sequence per line, comma separated")
+    parser.add_argument("-o", "--out", required=True, help="Structure files, one per sequence file, comma separated")
+    parser.add_argument("-t", "--temp", type=float, default=37, help="Folding temperature. Default: 37")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="Number of folding processes. Default: 1")
+    parser.add_argument("-b", "--backend", choices=list(backends), default="rnafold", help="Default: rnafold")
+    parser.add_argument(
+        "-c",
+        "--chunk",
+        type=int,
+        default=CHUNK_NUCLEOTIDES,
+        help=f"Nucleotides per chunk. Default: {CHUNK_NUCLEOTIDES}",
+    )
+    parser.add_argument("-u", "--unique", action="store_true", help="Fold each distinct sequence of all files once")
+    parser.add_argument(
+        "-s", "--annotate", action="store_true", help="Write sequence, structure and 7-letter annotation lines"
+    )
+    parser.add_argument("-C", "--cache", help="Folding cache (SQLite database, created if missing)")
+    parser.add_argument(
+        "-M", "--cache-max", type=int, help="Maximum number of cached structures, least recently used are removed"
+    )
+    args = parser.parse_args()
+
+    filenames = args.input.split(",")
+    outfilenames = args.out.split(",")
+    if len(filenames) != len(outfilenames):
+        parser.error("-i and -o must list the same number of files")
+    if args.workers < 1 or args.chunk < 1:
+        parser.error("-j and -c must be at least 1")
+    if args.cache_max is not None and (args.cache is None or args.cache_max < 0):
+        parser.error("-M needs -C and must be at least 0")
+    for filename in filenames:
+        if not os.path.exists(filename):
+            sys.stderr.write(f"Error: File '{filename}' not found\n")
+            sys.exit(1)
+    if not backend_available(args.backend):
+        sys.stderr.write(f"Error: Folding backend '{args.backend}' is not available (RNAfold / ViennaRNA not found)\n")
+        sys.exit(1)
+
+    cache = None
+    if args.cache:
+        try:
+            cache = open_cache(args.cache, f"{backend_version(args.backend)} T={args.temp:g}")
+        except sqlite3.Error as e:
+            sys.stderr.write(f"Error opening folding cache: {e}\n")
+            sys.exit(1)
+
+    try:
+        fold_files(
+            filenames,
+            outfilenames,
+            args.temp,
+            args.workers,
+            args.backend,
+            args.chunk,
+            cache,
+            args.unique,
+            args.annotate,
+        )
+        if cache is not None:
+            evicted = evict(cache, args.cache_max) if args.cache_max is not None else 0
+            print(f"Folding cache: {cache['hits']} hits, {cache['misses']} misses, {evicted} structures evicted")
+    except (IOError, RuntimeError, sqlite3.Error) as e:
+        sys.stderr.write(f"Error folding probes: {e}\n")
+        sys.exit(1)
+    finally:
+        if cache is not None:
+            close_cache(cache)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Annotate dot-bracket secondary structures with the 7-letter structure
+alphabet, giving the same annotations as utils/parse_secondary_structure_v2
+in time linear in the structure length, and usable on batches of structures
+from Python without writing them to a file.
+
+Alphabet:
+    L  paired, 5' end  (
+    R  paired, 3' end  )
+    H  hairpin loop
+    T  internal loop
+    B  bulge loop
+    M  multiloop
+    E  external region
+
+USAGE:
+    parse_secondary_structure.py <structures> <annotations>
+
+As parse_secondary_structure_v2, the first field of each line of the
+structures file holding a "." is annotated, and lines without unpaired bases
+are skipped.
+"""
+
+import re
+import sys
+
+STEM_LETTERS = str.maketrans("()", "LR")
+UNPAIRED_RUN = re.compile(r"\.+")
+# A stem closing followed by another stem opening, with or without unpaired
+# bases between them
+STEM_SWITCH = re.compile(r"\)\.*\(")
+
+
+def annotate_structure(structure):
+    """
+    7-letter annotation of one dot-bracket structure. Raises ValueError on
+    unbalanced brackets or other characters.
+    """
+    n = len(structure)
+    pairs = [-1] * n
+    # True for the closing bases of pairs that are enclosed by another pair
+    enclosed = [False] * n
+    stack = []
+    for i, c in enumerate(structure):
+        if c == "(":
+            stack.append(i)
+        elif c == ")":
+            if not stack:
+                raise ValueError(f"Unbalanced structure '{structure}'")
+            j = stack.pop()
+            pairs[i] = j
+            pairs[j] = i
+            enclosed[i] = bool(stack)
+        elif c != ".":
+            raise ValueError(f"Invalid structure character '{c}'")
+    if stack:
+        raise ValueError(f"Unbalanced structure '{structure}'")
+
+    # Loop type of each run of unpaired bases, from the bases k and m closing
+    # it on the left and right. N marks interior loops or bulges that may
+    # still turn out to be part of a multiloop
+    runs = [(r.start(), r.end()) for r in UNPAIRED_RUN.finditer(structure)]
+    loops = {}
+    for start, m in runs:
+        k = start - 1
+        if k < 0 or m == n:
+            loops[start] = "E"
+        elif structure[k] == "(" and structure[m] == ")":
+            loops[start] = "H"
+        elif structure[k] == structure[m]:
+            loops[start] = "B" if pairs[m] + 1 == pairs[k] else "N"
+        else:
+            loops[start] = "M" if enclosed[k] else "E"
+
+    # Where a stem closes and another opens within a multiloop, the N loops
+    # just outside the two stems are part of the multiloop
+    run_ends = {m: start for start, m in runs}
+    multiloop = set()
+    for switch in STEM_SWITCH.finditer(structure):
+        k = switch.start()
+        m = switch.end() - 1
+        if m > k + 1 and loops[k + 1] != "M":
+            continue
+        multiloop.add(run_ends.get(pairs[k]))
+        multiloop.add(pairs[m] + 1)
+
+    pieces = []
+    last = 0
+    for start, end in runs:
+        loop = loops[start]
+        if loop == "N":
+            loop = "M" if start in multiloop else "T"
+        pieces.append(structure[last:start].translate(STEM_LETTERS))
+        pieces.append(loop * (end - start))
+        last = end
+    pieces.append(structure[last:].translate(STEM_LETTERS))
+    return "".join(pieces)
+
+
+def annotate_structures(structures):
+    """7-letter annotations of a batch of dot-bracket structures."""
+    return [annotate_structure(s) for s in structures]
+
+
+def main():
+    if len(sys.argv) != 3:
+        sys.stderr.write("Usage: parse_secondary_structure.py <structures> <annotations>\n")
+        sys.exit(1)
+    try:
+        with open(sys.argv[1]) as infile, open(sys.argv[2], "w") as outfile:
+            for line in infile:
+                if "." in line:
+                    outfile.write(annotate_structure(line.split()[0]) + "\n")
+    except (IOError, ValueError) as e:
+        sys.stderr.write(f"Error: {e}\n")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
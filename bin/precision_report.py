@@ -0,0 +1,130 @@
+"""
+Compare PFM scores computed with a reduced precision (PFM_scan.py -P float32
+or int16) against the float64 scores of the same probes, to decide whether
+the reduced precision can be used.
+Both score sets are feature matrices or tables with a leading class column
+as written by feature_matrix.py assemble, the float64 scores must be a
+float64 matrix (PFM_scan.py -b -d, feature_matrix.py assemble -d) or a table. If a model and its training set are
+given, the AUROC of the model on each score set is reported as well.
+
+USAGE:
+    precision_report.py -r <float64_scores> -c <reduced_scores>
+                        [-m <model.sav> -T <LR_training_set>] [-o <report>]
+
+OUTPUT:
+A two column table (written to stdout by default):
+    max_abs_error     Largest absolute score difference
+    max_rel_error     Largest score difference relative to the largest
+                      float64 score of the same feature
+    max_rank_error    Largest change in the rank of a probe among all probes
+                      for one feature (ties get their average rank)
+    worst_feature     Feature with the largest rank error
+    auroc_float64     AUROC of the model on the float64 scores
+    auroc_reduced     AUROC of the model on the reduced precision scores
+    auroc_difference  auroc_reduced - auroc_float64
+"""
+
+import os
+import pickle
+import sys
+from argparse import ArgumentParser
+
+import numpy as np
+from feature_matrix import load_matrix
+from scipy.stats import rankdata
+from sklearn.metrics import roc_auc_score
+from sklearn.preprocessing import StandardScaler
+
+
+def score_errors(reference, compared):
+    """
+    Largest absolute, relative and rank error of compared scores (probes x
+    features) against reference scores, and the feature of the largest rank
+    error.
+    """
+    reference = np.asarray(reference, dtype=np.float64)
+    compared = np.asarray(compared, dtype=np.float64)
+    abs_error = np.abs(compared - reference)
+    scale = np.abs(reference).max(axis=0, initial=0)
+    rel_error = abs_error[:, scale > 0] / scale[scale > 0]
+    rank_error = np.abs(rankdata(compared, axis=0) - rankdata(reference, axis=0)).max(axis=0)
+    return (
+        float(abs_error.max(initial=0)),
+        float(rel_error.max(initial=0)),
+        float(rank_error.max(initial=0)),
+        int(np.argmax(rank_error)) if len(rank_error) else 0,
+    )
+
+
+def model_auroc(model, Xtrain, scores):
+    """AUROC of a model on a score set (class column first), scaled as in test_PRIESSTESS_model.py."""
+    scaler = StandardScaler()
+    scaler.fit(Xtrain)
+    return roc_auc_score(scores[:, 0], model.predict_proba(scaler.transform(scores[:, 1:]))[:, 1])
+
+
+def main():
+    parser = ArgumentParser(description="Report errors of reduced precision PFM scores against float64 scores")
+    parser.add_argument("-r", "--reference", required=True, help="float64 scores")
+    parser.add_argument("-c", "--compared", required=True, help="Reduced precision scores")
+    parser.add_argument("-m", "--model", help="PRIESSTESS model (*.sav)")
+    parser.add_argument("-T", "--train", help="Training set of the model")
+    parser.add_argument("-o", "--out", help="Report file. Default: stdout")
+    args = parser.parse_args()
+
+    if bool(args.model) != bool(args.train):
+        parser.error("-m and -T must be given together")
+    for filename in [args.reference, args.compared, args.model, args.train]:
+        if filename and not os.path.exists(filename):
+            sys.stderr.write(f"Error: File '{filename}' not found\n")
+            sys.exit(1)
+
+    try:
+        reference, columns = load_matrix(args.reference)
+        compared, compared_columns = load_matrix(args.compared)
+    except (IOError, ValueError) as e:
+        sys.stderr.write(f"Error reading scores: {e}\n")
+        sys.exit(1)
+    if reference.dtype != np.float64:
+        sys.stderr.write(f"Error: Reference scores are {reference.dtype}, not float64\n")
+        sys.exit(1)
+    if columns != compared_columns or reference.shape != compared.shape:
+        sys.stderr.write("Error: Score sets differ in shape or features\n")
+        sys.exit(1)
+
+    abs_error, rel_error, rank_error, worst = score_errors(reference[:, 1:], compared[:, 1:])
+    report = [
+        ("max_abs_error", abs_error),
+        ("max_rel_error", rel_error),
+        ("max_rank_error", rank_error),
+        ("worst_feature", columns[1 + worst] if len(columns) > 1 else "NA"),
+    ]
+
+    if args.model:
+        try:
+            model = pickle.load(open(args.model, "rb"))
+            Xtrain = load_matrix(args.train)[0][:, 1:]
+        except (pickle.UnpicklingError, IOError, ValueError) as e:
+            sys.stderr.write(f"Error loading model or training set: {e}\n")
+            sys.exit(1)
+        try:
+            auroc = model_auroc(model, Xtrain, reference)
+            reduced_auroc = model_auroc(model, Xtrain, compared)
+        except Exception as e:
+            sys.stderr.write(f"Error calculating AUROC: {e}\n")
+            sys.exit(1)
+        report += [
+            ("auroc_float64", auroc),
+            ("auroc_reduced", reduced_auroc),
+            ("auroc_difference", reduced_auroc - auroc),
+        ]
+
+    outfile = open(args.out, "w") if args.out else sys.stdout
+    for name, value in report:
+        outfile.write(f"{name}\t{value}\n")
+    if args.out:
+        outfile.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Read the foreground and background probe files, draw the probes of the
+STREME, logistic regression and test sets at random and write only those,
+so probes that are never used are not folded or annotated.
+
+Lines containing an "N" are removed and carriage returns are stripped. Each
+input file (one sequence per line, optionally gzipped) is sampled in one
+pass with reservoir sampling, holding only the drawn probes in memory. If
+no number of probes N is given, N is the number of probes in the smaller
+file, which is counted in an extra pass first.
+
+From each file N * percentage / 100 probes are drawn for each set (rounded
+down) and the sampled file holds the STREME probes, then the logistic
+regression probes, then the test probes, each set in input order. The same
+seed draws the same probes.
+
+USAGE:
+    sample_probes.py -i <fg>,<bg> -o <fg_seqs.txt>,<bg_seqs.txt>
+                     -p <STREME %>,<LR %>,<test %> [-N <probes>] [-s <seed>]
+
+OUTPUT:
+The sampled files, and the N used written to stdout.
+"""
+
+import gzip
+import random
+import sys
+from argparse import ArgumentParser
+
+
+def read_probes(filename):
+    """Yield the probes of a file, skipping lines containing an N."""
+    with gzip.open(filename, "rt") if filename.endswith(".gz") else open(filename) as f:
+        for line in f:
+            if "N" not in line:
+                yield line.rstrip("\n").replace("\r", "")
+
+
+def count_probes(filename):
+    """Number of probes of a file."""
+    return sum(1 for _ in read_probes(filename))
+
+
+def reservoir_sample(probes, k, rng):
+    """
+    Uniform random sample of k (index, probe) pairs of an iterable, or of all
+    of them if it has fewer, in random order. Returns the sample and the
+    number of probes read.
+    """
+    sample = []
+    n = 0
+    for n, probe in enumerate(probes, 1):
+        if n <= k:
+            sample.append((n, probe))
+        else:
+            j = rng.randrange(n)
+            if j < k:
+                sample[j] = (n, probe)
+    rng.shuffle(sample)
+    return sample, n
+
+
+def split_sample(sample, sizes):
+    """Split a shuffled sample into sets of the given sizes, each in input order."""
+    sets = []
+    start = 0
+    for size in sizes:
+        sets.append(sorted(sample[start : start + size]))
+        start += size
+    return sets
+
+
+def main():
+    parser = ArgumentParser(description="Sample the probes of the STREME, LR and test sets before folding")
+    parser.add_argument("-i", "--input", required=True, help="Comma separated probe files (*.gz allowed)")
+    parser.add_argument("-o", "--out", required=True, help="Comma separated sampled files, one per input")
+    parser.add_argument("-p", "--percentages", required=True, help="STREME, LR and test percentages, Ex. 50,25,25")
+    parser.add_argument("-N", "--probes", type=int, default=0, help="Probes per file. Default: smaller file")
+    parser.add_argument("-s", "--seed", type=int, default=1, help="Random seed. Default: 1")
+    args = parser.parse_args()
+
+    filenames = args.input.split(",")
+    outfilenames = args.out.split(",")
+    if len(filenames) != len(outfilenames):
+        parser.error("-i and -o must list the same number of files")
+    try:
+        percentages = [int(p) for p in args.percentages.split(",")]
+    except ValueError:
+        percentages = []
+    if len(percentages) != 3 or min(percentages) < 0 or sum(percentages) > 100:
+        parser.error("-p must be 3 integer percentages adding up to 100 or less")
+
+    try:
+        N = args.probes if args.probes > 0 else min(count_probes(filename) for filename in filenames)
+        sizes = [N * p // 100 for p in percentages]
+        rng = random.Random(args.seed)
+        for filename, outfilename in zip(filenames, outfilenames):
+            sample, n = reservoir_sample(read_probes(filename), sum(sizes), rng)
+            if n < sum(sizes):
+                sys.stderr.write(f"Error: {filename} has {n} probes, fewer than the {sum(sizes)} to sample\n")
+                sys.exit(1)
+            with open(outfilename, "w") as outfile:
+                for probes in split_sample(sample, sizes):
+                    outfile.writelines(probe + "\n" for _, probe in probes)
+    except (IOError, EOFError) as e:
+        sys.stderr.write(f"Error reading probes: {e}\n")
+        sys.exit(1)
+    print(N)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Read the motifs found by STREME from streme.txt in one pass, and write the
+PFM of each motif that passes the p-value cutoff together with a manifest of
+all motifs.
+
+The last three motifs STREME reports never meet its p-value threshold, so
+only the others are considered. A motif passes if its p-value is below the
+Bonferroni corrected cutoff 0.01 / (number of motifs considered), compared
+as log2 values so that p-values below the smallest float are handled. When
+STREME reports an E-value instead of a p-value, the p-value is the E-value
+divided by the number of sites. Only motifs ranked up to the maximum number
+of motifs get a PFM.
+
+USAGE:
+    streme_motifs.py <streme.txt> [-m <max motifs>] [-o <out dir>]
+
+OUTPUT:
+    PFM-<rank>.txt  One row per alphabet letter: the letter and its
+                    probability at each motif position (tab separated)
+    motifs.tab      Manifest with a header line and one line per motif
+                    considered: rank, motif, width, nsites, log2 p-value and
+                    PFM file (NA if no PFM was written)
+"""
+
+import math
+import os
+import re
+import sys
+from argparse import ArgumentParser
+
+# p-value cutoff before Bonferroni correction
+P_CUTOFF = 0.01
+MOTIF_LINE = re.compile(r"MOTIF (\d+)-(\S*)")
+
+
+def log2_number(num):
+    """
+    log2 of a number written as text, Ex. 1.6e-300 or 1,6e-300, computed
+    from the mantissa and exponent so that it does not underflow.
+    """
+    num = num.replace(",", ".")
+    if "e" in num:
+        mantissa, exponent = num.split("e")
+        if float(mantissa) <= 0:
+            raise ValueError(f"Invalid p-value '{num}'")
+        return math.log2(float(mantissa)) + float(exponent) * math.log2(10)
+    if float(num) <= 0:
+        raise ValueError(f"Invalid p-value '{num}'")
+    return math.log2(float(num))
+
+
+def motif_field(pattern, info):
+    """Value of a field of the line following a MOTIF line."""
+    match = re.search(pattern, info)
+    if match is None:
+        raise ValueError(f"Invalid motif information '{info}'")
+    return match.group(1)
+
+
+def read_streme(filename):
+    """
+    Return (alphabet letters, motifs) of a streme.txt file. Each motif is a
+    dict with its rank, name, width, nsites, log2 p-value and probability rows
+    (one list of values per motif position, as written by STREME).
+    """
+    with open(filename) as f:
+        lines = f.read().split("\n")
+    # The first line holding "?" is the wildcard of the alphabet, Ex. "? = UP"
+    letters = next(("".join(re.findall("[A-Za-z]", line)) for line in lines if "?" in line), "")
+    motifs = []
+    for k, line in enumerate(lines):
+        if "MOTIF" not in line:
+            continue
+        match = MOTIF_LINE.search(line)
+        if match is None or k + 1 == len(lines):
+            raise ValueError(f"Invalid motif line '{line}'")
+        info = lines[k + 1]
+        width = int(motif_field(r"w=\s*(\d+)", info))
+        nsites = int(motif_field(r"nsites=\s*(\d+)", info))
+        if " P=" in info:
+            log2_p = log2_number(motif_field(r" P=\s*([e.,0-9-]+)", info))
+        else:
+            # E-value = p-value * number of motifs reported by STREME
+            log2_p = log2_number(motif_field(r"E=\s*([e.,0-9-]+)", info)) - math.log2(nsites)
+        motifs.append(
+            {
+                "rank": int(match.group(1)),
+                "name": match.group(1) + "-" + match.group(2),
+                "width": width,
+                "nsites": nsites,
+                "log2_p": log2_p,
+                "rows": [row.split() for row in lines[k + 2 : k + 2 + width]],
+            }
+        )
+    return letters, motifs
+
+
+def write_motifs(letters, motifs, max_motifs, out_dir="."):
+    """
+    Write the PFMs of the motifs passing the cutoff and the manifest. Returns
+    the number of PFMs written.
+    """
+    # The last three motifs never meet the p-value cutoff
+    considered = motifs[:-3]
+    written = 0
+    with open(os.path.join(out_dir, "motifs.tab"), "w") as manifest:
+        manifest.write("rank\tmotif\twidth\tnsites\tlog2_p\tPFM\n")
+        if not considered:
+            return 0
+        log2_cutoff = math.log2(P_CUTOFF / len(considered))
+        for motif in considered:
+            PFM_file = "NA"
+            if motif["log2_p"] < log2_cutoff and motif["rank"] <= max_motifs:
+                rows = motif["rows"]
+                if len(rows) != motif["width"] or any(len(row) != len(letters) for row in rows):
+                    raise ValueError(f"Motif {motif['name']} does not have {len(letters)} letters at each position")
+                PFM_file = f"PFM-{motif['rank']}.txt"
+                with open(os.path.join(out_dir, PFM_file), "w") as f:
+                    for i, letter in enumerate(letters):
+                        f.write("\t".join([letter] + [row[i] for row in motif["rows"]]) + "\n")
+                written += 1
+            manifest.write(
+                f"{motif['rank']}\t{motif['name']}\t{motif['width']}\t{motif['nsites']}\t{motif['log2_p']:.6f}\t"
+                f"{PFM_file}\n"
+            )
+    return written
+
+
+def main():
+    parser = ArgumentParser(description="Write the PFMs of the STREME motifs passing the p-value cutoff")
+    parser.add_argument("streme", help="streme.txt file")
+    parser.add_argument("-m", "--max-motifs", type=int, default=40, help="Maximum motif rank to keep. Default: 40")
+    parser.add_argument("-o", "--out", default=".", help="Output directory. Default: .")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.streme):
+        sys.stderr.write(f"Error: File '{args.streme}' not found\n")
+        sys.exit(1)
+    try:
+        written = write_motifs(*read_streme(args.streme), args.max_motifs, args.out)
+    except (IOError, ValueError) as e:
+        sys.stderr.write(f"Error reading STREME motifs: {e}\n")
+        sys.exit(1)
+    print(f"{written} PFMs written")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@ import os
 import pickle
 import sys
 
-import numpy as np
+from feature_matrix import load_matrix
 from sklearn.metrics import roc_auc_score
 from sklearn.preprocessing import StandardScaler
 
@@ -22,15 +22,15 @@ for filepath, name in [(trainfile, "training"), (testfile, "test"), (trainmodel,
         sys.stderr.write(f"Error: {name.capitalize()} file '{filepath}' not found\n")
         sys.exit(1)
 
-# Load in data
+# Load in data, feature matrices (*.npy) are memory mapped
 try:
-    trainset = np.loadtxt(trainfile, delimiter="\t", skiprows=1)
+    trainset = load_matrix(trainfile)[0]
 except (IOError, ValueError) as e:
     sys.stderr.write(f"Error reading training file '{trainfile}': {e}\n")
     sys.exit(1)
 
 try:
-    testset = np.loadtxt(testfile, delimiter="\t", skiprows=1)
+    testset = load_matrix(testfile)[0]
 except (IOError, ValueError) as e:
     sys.stderr.write(f"Error reading test file '{testfile}': {e}\n")
     sys.exit(1)
@@ -96,3 +96,119 @@ class TestAnnotateAlphabets:
         assert result.returncode == 1
         # Either invalid character or other error is fine
         assert result.returncode != 0
+
+    def test_annotate_alphabets_output(self, temp_dir):
+        """All derived alphabets are written for every probe, with line-numbered IDs."""
+        input_file = os.path.join(temp_dir, "input.tab")
+        with open(input_file, "w") as f:
+            f.write("GACUACGAUAGUU\t.(((.....))).\tELLLHHHHHRRRE\n")
+            f.write("GCCCCUAACACGU\t.............\tEEEEEEEEEEEEE\n")
+            f.write("ACGUACGUACGUACGUACGUACGUACGU\t.\tBBBBEEEEHHHHLLLLMMMMRRRRTTTT\n")
+
+        result = subprocess.run(
+            [sys.executable, str(BIN_DIR / "annotate_alphabets.py"), input_file, "fg"],
+            capture_output=True,
+            text=True,
+            cwd=temp_dir,
+        )
+        assert result.returncode == 0, result.stderr
+
+        with open(os.path.join(temp_dir, "fg_alphabet_annotations.tab")) as f:
+            assert f.read() == (
+                "fg_1\tGACUACGAUAGUU\tEBDHACEAGBFHG\tKAEMBFJBNAIMO\tPDKYCJQCXFTaW\tUPPPUUUUUPPPU\tUPPPLLLLLPPPU"
+                "\tELLLHHHHHRRRE\n"
+                "fg_2\tGCCCCUAACACGU\tECCCCGAACACEG\tKGGGGOCCGCGKO\tPIIIIWBBIBIPW\tUUUUUUUUUUUUU\tUUUUUUUUUUUUU"
+                "\tEEEEEEEEEEEEE\n"
+                "fg_3\tACGUACGUACGUACGUACGUACGUACGU\tACEGACEGACEGBDFHACEGBDFHACEG\tDHLPCGKOBFJNAEIMDHLPAEIMDHLP"
+                "\tAHOVBIPWCJQXDKRYELSZFMTaGNUb\tUUUUUUUUUUUUPPPPUUUUPPPPUUUU\tMMMMUUUULLLLPPPPMMMMPPPPMMMM"
+                "\tBBBBEEEEHHHHLLLLMMMMRRRRTTTT\n"
+            )
+
+    def test_annotate_alphabets_empty_file(self, temp_dir):
+        """Test with an empty input file."""
+        input_file = os.path.join(temp_dir, "input.tab")
+        open(input_file, "w").close()
+        result = subprocess.run(
+            [sys.executable, str(BIN_DIR / "annotate_alphabets.py"), input_file, os.path.join(temp_dir, "test")],
+            capture_output=True,
+            text=True,
+        )
+        assert result.returncode == 1
+        assert "empty" in result.stderr
+
+    def test_annotate_alphabets_selected(self, temp_dir):
+        """Only the requested alphabets are written, in the canonical column order."""
+        input_file = os.path.join(temp_dir, "input.tab")
+        with open(input_file, "w") as f:
+            f.write("GACUACGAUAGUU\t.(((.....))).\tELLLHHHHHRRRE\n")
+
+        result = subprocess.run(
+            [sys.executable, str(BIN_DIR / "annotate_alphabets.py"), input_file, "fg", "struct-7,seq-struct-16"],
+            capture_output=True,
+            text=True,
+            cwd=temp_dir,
+        )
+        assert result.returncode == 0, result.stderr
+        with open(os.path.join(temp_dir, "fg_alphabet_annotations.tab")) as f:
+            assert f.read() == "fg_1\tKAEMBFJBNAIMO\tELLLHHHHHRRRE\n"
+
+    def test_annotate_alphabets_sequence_only(self, temp_dir):
+        """With only seq-4 requested a file of sequences is annotated without structures."""
+        input_file = os.path.join(temp_dir, "seqs.txt")
+        with open(input_file, "w") as f:
+            f.write("GACUACGAUAGUU\nGCCCC\n")
+
+        result = subprocess.run(
+            [sys.executable, str(BIN_DIR / "annotate_alphabets.py"), input_file, "bg", "seq-4"],
+            capture_output=True,
+            text=True,
+            cwd=temp_dir,
+        )
+        assert result.returncode == 0, result.stderr
+        with open(os.path.join(temp_dir, "bg_alphabet_annotations.tab")) as f:
+            assert f.read() == "bg_1\tGACUACGAUAGUU\nbg_2\tGCCCC\n"
+
+    def test_annotate_alphabets_invalid_alphabet(self, temp_dir):
+        """Unknown alphabet names are rejected."""
+        input_file = os.path.join(temp_dir, "seqs.txt")
+        with open(input_file, "w") as f:
+            f.write("GACU\n")
+        result = subprocess.run(
+            [sys.executable, str(BIN_DIR / "annotate_alphabets.py"), input_file, "fg", "seq-4,struct-3"],
+            capture_output=True,
+            text=True,
+            cwd=temp_dir,
+        )
+        assert result.returncode == 1
+        assert "Invalid alphabet" in result.stderr
+
+    def test_annotate_alphabets_flanks(self, temp_dir):
+        """Flanks are removed from every alphabet, annotations with flanks are kept with -k."""
+        input_file = os.path.join(temp_dir, "input.tab")
+        with open(input_file, "w") as f:
+            f.write("GACUACGAUAGUU\t.(((.....))).\tELLLHHHHHRRRE\n")
+            f.write("GCC\t...\tEEE\n")
+
+        result = subprocess.run(
+            [
+                sys.executable,
+                str(BIN_DIR / "annotate_alphabets.py"),
+                input_file,
+                "fg",
+                "seq-4,struct-2,struct-7",
+                "-f5",
+                "2",
+                "-f3",
+                "3",
+                "-k",
+            ],
+            capture_output=True,
+            text=True,
+            cwd=temp_dir,
+        )
+        assert result.returncode == 0, result.stderr
+        with open(os.path.join(temp_dir, "fg_alphabet_annotations.tab")) as f:
+            # Annotations shorter than both flanks are left empty
+            assert f.read() == "fg_1\tCUACGAUA\tPPUUUUUP\tLLHHHHHR\nfg_2\t\t\t\n"
+        with open(os.path.join(temp_dir, "fg_alphabet_annotations_with_flanks.tab")) as f:
+            assert f.read() == "fg_1\tGACUACGAUAGUU\tUPPPUUUUUPPPU\tELLLHHHHHRRRE\nfg_2\tGCC\tUUU\tEEE\n"
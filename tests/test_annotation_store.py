@@ -0,0 +1,152 @@
+"""Tests for annotation_store.py."""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+
+BIN_DIR = Path(__file__).parent.parent / "bin"
+
+ALPHABET_LETTERS = {
+    "seq-4": "ACGU",
+    "struct-2": "PU",
+    "struct-7": "BEHLMRT",
+    "seq-struct-28": "ABCDEFGHIJKLMNOPQRSTUVWXYZab",
+}
+
+
+def write_annotations(temp_dir, n_probes=25, seed=5):
+    """Write a random annotation table and header; returns (table, header, rows)."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n_probes):
+        length = int(rng.integers(0, 30))
+        rows.append(
+            [f"fg_{i + 1}"] + ["".join(rng.choice(list(letters), size=length)) for letters in ALPHABET_LETTERS.values()]
+        )
+    table = os.path.join(temp_dir, "fg_alphabet_annotations.tab")
+    with open(table, "w") as f:
+        for row in rows:
+            f.write("\t".join(row) + "\n")
+    header = os.path.join(temp_dir, "annotation_alphabets_header.tab")
+    with open(header, "w") as f:
+        f.write("ID\t" + "\t".join(ALPHABET_LETTERS) + "\n")
+    return table, header, rows
+
+
+def run_store(*args, cwd=None):
+    return subprocess.run(
+        [sys.executable, str(BIN_DIR / "annotation_store.py")] + list(args),
+        capture_output=True,
+        text=True,
+        cwd=cwd,
+    )
+
+
+class TestAnnotationStore:
+    """Tests for the annotation_store.py script."""
+
+    def test_store_fasta_round_trip(self, temp_dir):
+        """Every alphabet is written back exactly as annotated."""
+        table, header, rows = write_annotations(temp_dir)
+        store = os.path.join(temp_dir, "fg_store")
+        result = run_store("build", table, header, store)
+        assert result.returncode == 0, result.stderr
+
+        # 1, 2, 3 and 5 bit alphabets are packed to 1, 2, 4 and 8 bits per letter
+        sizes = {a: os.path.getsize(os.path.join(store, a + ".npy")) for a in ALPHABET_LETTERS}
+        assert sizes["struct-2"] < sizes["seq-4"] < sizes["struct-7"] < sizes["seq-struct-28"]
+
+        for k, alph in enumerate(ALPHABET_LETTERS):
+            result = run_store("fasta", store, alph)
+            assert result.returncode == 0, result.stderr
+            assert result.stdout == "".join(f">{row[0]}\n{row[k + 1]}\n" for row in rows)
+
+    def test_store_fasta_line_numbers(self, temp_dir):
+        """Only the requested lines are written, in file order."""
+        table, header, rows = write_annotations(temp_dir)
+        store = os.path.join(temp_dir, "fg_store")
+        assert run_store("build", table, header, store).returncode == 0
+
+        numbers = os.path.join(temp_dir, "numbers.txt")
+        with open(numbers, "w") as f:
+            f.write("\n".join(["7", "2", "3", "25", "12"]) + "\n")
+        result = run_store("fasta", store, "struct-7", "-l", numbers)
+        assert result.returncode == 0, result.stderr
+        assert result.stdout == "".join(f">{rows[i - 1][0]}\n{rows[i - 1][3]}\n" for i in [2, 3, 7, 12, 25])
+
+    def test_store_split(self, temp_dir):
+        """split writes consecutive probes of every alphabet to each set, across several batches."""
+        table, header, rows = write_annotations(temp_dir, n_probes=20000)
+        assert run_store("build", table, header, "fg_store", cwd=temp_dir).returncode == 0
+        for alph in ALPHABET_LETTERS:
+            os.makedirs(os.path.join(temp_dir, alph))
+
+        result = run_store("split", "fg_store", "fg", "-s", "STREME:9000,LR:6000,test:4000", cwd=temp_dir)
+        assert result.returncode == 0, result.stderr
+        for k, alph in enumerate(ALPHABET_LETTERS):
+            for name, start, end in [("STREME", 0, 9000), ("LR", 9000, 15000), ("test", 15000, 19000)]:
+                with open(os.path.join(temp_dir, alph, f"fg_{name}.fa")) as f:
+                    assert f.read() == "".join(f">{row[0]}\n{row[k + 1]}\n" for row in rows[start:end])
+
+        result = run_store("split", "fg_store", "fg", "-s", "STREME:20001", cwd=temp_dir)
+        assert result.returncode == 1
+        assert "store only" in result.stderr
+
+    def test_store_line_numbers_out_of_range(self, temp_dir):
+        """Line numbers beyond the number of probes are rejected."""
+        table, header, rows = write_annotations(temp_dir)
+        store = os.path.join(temp_dir, "fg_store")
+        assert run_store("build", table, header, store).returncode == 0
+
+        numbers = os.path.join(temp_dir, "numbers.txt")
+        with open(numbers, "w") as f:
+            f.write("26\n")
+        result = run_store("fasta", store, "seq-4", "-l", numbers)
+        assert result.returncode == 1
+        assert "Line numbers" in result.stderr
+
+    def test_store_not_found(self, temp_dir):
+        """Reading a directory that is not a store fails."""
+        result = run_store("fasta", temp_dir, "seq-4")
+        assert result.returncode == 1
+        assert "not an annotation store" in result.stderr
+
+    def test_store_invalid_letter(self, temp_dir):
+        """Letters outside an alphabet are reported."""
+        table, header, rows = write_annotations(temp_dir)
+        with open(table, "a") as f:
+            f.write("fg_26\tACGX\tPUPU\tBEHL\tABCD\n")
+        result = run_store("build", table, header, os.path.join(temp_dir, "fg_store"))
+        assert result.returncode == 1
+        assert "not in alphabet" in result.stderr
+
+    def test_scan_store_matches_fasta(self, temp_dir):
+        """PFM_scan.py gives the same scores reading a store as reading a fasta."""
+        table, header, rows = write_annotations(temp_dir, n_probes=60)
+        store = os.path.join(temp_dir, "fg_store")
+        assert run_store("build", table, header, store).returncode == 0
+        fasta = os.path.join(temp_dir, "fg.fa")
+        with open(fasta, "w") as f:
+            f.write(run_store("fasta", store, "struct-7").stdout)
+
+        rng = np.random.default_rng(1)
+        PFM = rng.dirichlet(np.ones(7), size=4)
+        with open(os.path.join(temp_dir, "PFM-1.txt"), "w") as f:
+            for j, letter in enumerate(ALPHABET_LETTERS["struct-7"]):
+                f.write(letter + "\t" + "\t".join(str(v) for v in PFM[:, j]) + "\n")
+
+        outputs = []
+        for scanned in [store, fasta]:
+            result = subprocess.run(
+                [sys.executable, str(BIN_DIR / "PFM_scan.py"), "-a", "struct-7", "-f", scanned, "-p", "PFM", "-n", "2"],
+                capture_output=True,
+                text=True,
+                cwd=temp_dir,
+            )
+            assert result.returncode == 0, result.stderr
+            with open(os.path.join(temp_dir, "fg_PFM_scan_sum_top_2.tab")) as f:
+                outputs.append(f.read())
+        assert outputs[0] == outputs[1]
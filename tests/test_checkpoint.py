@@ -0,0 +1,51 @@
+"""Tests for checkpoint.py."""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BIN_DIR = Path(__file__).parent.parent / "bin"
+
+
+def run_checkpoint(temp_dir, *args):
+    return subprocess.run(
+        [sys.executable, str(BIN_DIR / "checkpoint.py")] + list(args),
+        capture_output=True,
+        text=True,
+        cwd=temp_dir,
+    )
+
+
+class TestCheckpoint:
+    """Tests for the checkpoint.py script."""
+
+    def test_key(self, temp_dir):
+        """The key changes with the values and with the contents of the files."""
+        with open(os.path.join(temp_dir, "fg.txt"), "w") as f:
+            f.write("ACGU\n")
+
+        def key(*args):
+            result = run_checkpoint(temp_dir, "key", *args)
+            assert result.returncode == 0, result.stderr
+            return result.stdout.strip()
+
+        first = key("50", "25", "-f", "fg.txt")
+        assert key("50", "25", "-f", "fg.txt") == first
+        assert key("5", "025", "-f", "fg.txt") != first
+        assert key("50", "25") != first
+        with open(os.path.join(temp_dir, "fg.txt"), "w") as f:
+            f.write("ACGA\n")
+        assert key("50", "25", "-f", "fg.txt") != first
+
+        result = run_checkpoint(temp_dir, "key", "50", "-f", "missing.txt")
+        assert result.returncode == 1
+        assert "Error" in result.stderr
+
+    def test_done_mark(self, temp_dir):
+        """A stage is done only once marked with the same key."""
+        assert run_checkpoint(temp_dir, "done", "checkpoints", "ingest", "abc").returncode == 1
+        assert run_checkpoint(temp_dir, "mark", "checkpoints", "ingest", "abc").returncode == 0
+        assert run_checkpoint(temp_dir, "done", "checkpoints", "ingest", "abc").returncode == 0
+        assert run_checkpoint(temp_dir, "done", "checkpoints", "ingest", "abd").returncode == 1
+        assert run_checkpoint(temp_dir, "done", "checkpoints", "split", "abc").returncode == 1
@@ -0,0 +1,151 @@
+"""Tests for feature_matrix.py."""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+
+BIN_DIR = Path(__file__).parent.parent / "bin"
+
+
+def write_scores(temp_dir, alph, name, scores, PFM_names, dtype=np.float32):
+    """Write a PFM_scan.py -b style matrix for one alphabet and file."""
+    os.makedirs(os.path.join(temp_dir, alph), exist_ok=True)
+    filename = os.path.join(temp_dir, alph, f"{name}_PFM_scan_sum_top_2.npy")
+    np.save(filename, scores.astype(dtype))
+    with open(filename[:-4] + ".columns", "w") as f:
+        f.write("".join(c + "\n" for c in PFM_names))
+    return filename
+
+
+def load_matrix(filename):
+    """Read a matrix and its column names."""
+    with open(filename[:-4] + ".columns") as f:
+        return np.load(filename), f.read().split()
+
+
+def run_assemble(temp_dir, alphs, *extra):
+    return subprocess.run(
+        [
+            sys.executable,
+            str(BIN_DIR / "feature_matrix.py"),
+            "assemble",
+            "-a",
+            alphs,
+            "-fg",
+            "{alph}/fg_LR_PFM_scan_sum_top_2.npy",
+            "-bg",
+            "{alph}/bg_LR_PFM_scan_sum_top_2.npy",
+            "-o",
+            "LR_training_set.npy",
+        ]
+        + list(extra),
+        capture_output=True,
+        text=True,
+        cwd=temp_dir,
+    )
+
+
+class TestFeatureMatrix:
+    """Tests for the feature_matrix.py script."""
+
+    def test_assemble_training_set(self, temp_dir):
+        """Alphabets are joined column-wise, fg rows above bg rows, with a class column."""
+        rng = np.random.default_rng(1)
+        scores = {}
+        for alph, n_PFMs in [("seq-4", 2), ("struct-2", 3)]:
+            for name, n_rows in [("fg_LR", 6), ("bg_LR", 4)]:
+                scores[alph, name] = rng.random((n_rows, n_PFMs))
+                write_scores(temp_dir, alph, name, scores[alph, name], [f"PFM-{k + 1}" for k in range(n_PFMs)])
+
+        result = run_assemble(temp_dir, "seq-4,struct-2", "-t")
+        assert result.returncode == 0, result.stderr
+
+        matrix, columns = load_matrix(os.path.join(temp_dir, "LR_training_set.npy"))
+        assert columns == ["class", "seq-4_PFM-1", "seq-4_PFM-2", "struct-2_PFM-1", "struct-2_PFM-2", "struct-2_PFM-3"]
+        expected = np.vstack(
+            [
+                np.column_stack([np.ones(6), scores["seq-4", "fg_LR"], scores["struct-2", "fg_LR"]]),
+                np.column_stack([np.zeros(4), scores["seq-4", "bg_LR"], scores["struct-2", "bg_LR"]]),
+            ]
+        ).astype(np.float32)
+        np.testing.assert_array_equal(matrix, expected)
+
+        # The tab separated export reads back to the same values
+        with open(os.path.join(temp_dir, "LR_training_set.tab")) as f:
+            assert f.readline() == "\t".join(columns) + "\n"
+        table = np.loadtxt(os.path.join(temp_dir, "LR_training_set.tab"), delimiter="\t", skiprows=1)
+        np.testing.assert_array_equal(table.astype(np.float32), expected)
+
+    def test_assemble_max_rank(self, temp_dir):
+        """With -r only the columns of PFMs ranked up to the given rank are kept."""
+        rng = np.random.default_rng(3)
+        scores = {}
+        PFM_names = ["PFM-1", "PFM-10", "PFM-2", "PFM-3"]
+        for name, n_rows in [("fg_LR", 5), ("bg_LR", 3)]:
+            scores[name] = rng.random((n_rows, 4))
+            write_scores(temp_dir, "seq-4", name, scores[name], PFM_names)
+
+        result = run_assemble(temp_dir, "seq-4", "-r", "2")
+        assert result.returncode == 0, result.stderr
+        matrix, columns = load_matrix(os.path.join(temp_dir, "LR_training_set.npy"))
+        assert columns == ["class", "seq-4_PFM-1", "seq-4_PFM-2"]
+        expected = np.vstack(
+            [
+                np.column_stack([np.ones(5), scores["fg_LR"][:, [0, 2]]]),
+                np.column_stack([np.zeros(3), scores["bg_LR"][:, [0, 2]]]),
+            ]
+        ).astype(np.float32)
+        np.testing.assert_array_equal(matrix, expected)
+
+    def test_assemble_double(self, temp_dir):
+        """With -d float64 matrices are assembled and exported without rounding."""
+        rng = np.random.default_rng(5)
+        scores = {}
+        for name, n_rows in [("fg_LR", 5), ("bg_LR", 3)]:
+            scores[name] = rng.random((n_rows, 2))
+            write_scores(temp_dir, "seq-4", name, scores[name], ["PFM-1", "PFM-2"], np.float64)
+
+        result = run_assemble(temp_dir, "seq-4", "-d", "-t")
+        assert result.returncode == 0, result.stderr
+        matrix, columns = load_matrix(os.path.join(temp_dir, "LR_training_set.npy"))
+        assert matrix.dtype == np.float64
+        expected = np.vstack(
+            [
+                np.column_stack([np.ones(5), scores["fg_LR"]]),
+                np.column_stack([np.zeros(3), scores["bg_LR"]]),
+            ]
+        )
+        np.testing.assert_array_equal(matrix, expected)
+        table = np.loadtxt(os.path.join(temp_dir, "LR_training_set.tab"), delimiter="\t", skiprows=1)
+        np.testing.assert_array_equal(table, expected)
+
+    def test_assemble_row_mismatch(self, temp_dir):
+        """Alphabets scanned on different numbers of probes are rejected."""
+        rng = np.random.default_rng(2)
+        for alph, n_rows in [("seq-4", 5), ("struct-2", 4)]:
+            for name in ["fg_LR", "bg_LR"]:
+                write_scores(temp_dir, alph, name, rng.random((n_rows, 2)), ["PFM-1", "PFM-2"])
+        result = run_assemble(temp_dir, "seq-4,struct-2")
+        assert result.returncode == 1
+        assert "different number of rows" in result.stderr
+
+    def test_assemble_file_not_found(self, temp_dir):
+        """Missing score matrices are reported."""
+        result = run_assemble(temp_dir, "seq-4")
+        assert result.returncode == 1
+        assert "not found" in result.stderr
+
+    def test_tsv_export(self, temp_dir):
+        """tsv writes the header and rows of a matrix to stdout."""
+        scores = np.array([[1.5, 0.25], [0, 3]])
+        filename = write_scores(temp_dir, "seq-4", "fg_LR", scores, ["PFM-1", "PFM-2"])
+        result = subprocess.run(
+            [sys.executable, str(BIN_DIR / "feature_matrix.py"), "tsv", filename],
+            capture_output=True,
+            text=True,
+        )
+        assert result.returncode == 0, result.stderr
+        assert result.stdout == "PFM-1\tPFM-2\n1.5\t0.25\n0\t3\n"
@@ -0,0 +1,177 @@
+"""Tests for fold_probes.py."""
+
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+BIN_DIR = Path(__file__).parent.parent / "bin"
+
+
+def write_seqs(temp_dir, name, n_probes, seed):
+    """Write random probe sequences, one per line; returns the file name and sequences."""
+    rng = np.random.default_rng(seed)
+    seqs = ["".join(rng.choice(list("ACGU"), size=int(rng.integers(10, 40)))) for _ in range(n_probes)]
+    filename = os.path.join(temp_dir, name)
+    with open(filename, "w") as f:
+        f.write("".join(s + "\n" for s in seqs))
+    return filename, seqs
+
+
+def run_fold(temp_dir, *args):
+    return subprocess.run(
+        [sys.executable, str(BIN_DIR / "fold_probes.py")] + list(args),
+        capture_output=True,
+        text=True,
+        cwd=temp_dir,
+    )
+
+
+class TestFoldProbes:
+    """Tests for the fold_probes.py script."""
+
+    def test_fold_workers_keep_input_order(self, temp_dir):
+        """Chunks of several files folded by several workers are written back in input order."""
+        fg, fg_seqs = write_seqs(temp_dir, "fg_seqs.txt", 300, 1)
+        bg, bg_seqs = write_seqs(temp_dir, "bg_seqs.txt", 200, 2)
+
+        outputs = []
+        for workers in ["1", "3"]:
+            result = run_fold(
+                temp_dir, "-i", f"{fg},{bg}", "-o", "fg.tab,bg.tab", "-b", "stub", "-j", workers, "-c", "500"
+            )
+            assert result.returncode == 0, result.stderr
+            structures = []
+            for name, seqs in [("fg.tab", fg_seqs), ("bg.tab", bg_seqs)]:
+                with open(os.path.join(temp_dir, name)) as f:
+                    structures.append(f.read().split("\n")[:-1])
+                assert [len(s) for s in structures[-1]] == [len(s) for s in seqs]
+            outputs.append(structures)
+        assert outputs[0] == outputs[1]
+
+        for structure in outputs[0][0] + outputs[0][1]:
+            assert set(structure) <= set(".()") and structure.count("(") == structure.count(")")
+
+    def test_fold_stub_structure(self, temp_dir):
+        """The stub backend closes the outermost stem around a loop of at least 3 bases."""
+        filename = os.path.join(temp_dir, "seqs.txt")
+        with open(filename, "w") as f:
+            f.write("GGGAAAUCCC\nGAAAAAAU\nAAAA\n")
+        result = run_fold(temp_dir, "-i", filename, "-o", "structures.tab", "-b", "stub")
+        assert result.returncode == 0, result.stderr
+        with open(os.path.join(temp_dir, "structures.tab")) as f:
+            assert f.read() == "(((....)))\n(......)\n....\n"
+
+    def test_fold_file_count_mismatch(self, temp_dir):
+        """-i and -o must name the same number of files."""
+        filename, _ = write_seqs(temp_dir, "seqs.txt", 5, 3)
+        result = run_fold(temp_dir, "-i", filename, "-o", "a.tab,b.tab", "-b", "stub")
+        assert result.returncode == 2
+        assert "same number of files" in result.stderr
+
+    def test_fold_unique_sequences(self, temp_dir):
+        """-u folds each distinct sequence of all files once and writes the same structures."""
+        rng = np.random.default_rng(8)
+        distinct = ["".join(rng.choice(list("ACGU"), size=int(rng.integers(10, 40)))) for _ in range(30)]
+        probes = {"fg_seqs.txt": rng.integers(0, 30, size=200), "bg_seqs.txt": rng.integers(0, 30, size=150)}
+        for name, indices in probes.items():
+            with open(os.path.join(temp_dir, name), "w") as f:
+                f.write("".join(distinct[k] + "\n" for k in indices))
+
+        command = ["-i", "fg_seqs.txt,bg_seqs.txt", "-o", "fg.tab,bg.tab", "-b", "stub", "-j", "2", "-c", "400"]
+        outputs = []
+        for extra in [[], ["-u"]]:
+            result = run_fold(temp_dir, *command, *extra)
+            assert result.returncode == 0, result.stderr
+            outputs.append([open(os.path.join(temp_dir, name)).read() for name in ["fg.tab", "bg.tab"]])
+        assert outputs[0] == outputs[1]
+        n_distinct = len(set(np.concatenate(list(probes.values()))))
+        assert f"Folded {n_distinct} sequences for 350 probes" in result.stdout
+
+    def test_fold_cache_hits(self, temp_dir):
+        """A second run reads every structure from the cache and writes the same output."""
+        filename, seqs = write_seqs(temp_dir, "seqs.txt", 100, 5)
+        outputs = []
+        reports = []
+        for run in range(2):
+            result = run_fold(
+                temp_dir,
+                "-i",
+                filename,
+                "-o",
+                f"run{run}.tab",
+                "-b",
+                "stub",
+                "-j",
+                "2",
+                "-c",
+                "300",
+                "-C",
+                "cache.sqlite",
+            )
+            assert result.returncode == 0, result.stderr
+            reports.append(result.stdout)
+            with open(os.path.join(temp_dir, f"run{run}.tab")) as f:
+                outputs.append(f.read())
+        assert outputs[0] == outputs[1]
+        assert "Folding cache: 0 hits, 100 misses" in reports[0]
+        assert "Folding cache: 100 hits, 0 misses, 0 structures evicted" in reports[1]
+
+        # Other temperatures are cached separately
+        result = run_fold(temp_dir, "-i", filename, "-o", "t20.tab", "-b", "stub", "-t", "20", "-C", "cache.sqlite")
+        assert "Folding cache: 0 hits, 100 misses" in result.stdout
+
+    def test_fold_cache_eviction(self, temp_dir):
+        """The least recently used structures are removed beyond the cache size limit."""
+        first, first_seqs = write_seqs(temp_dir, "first.txt", 50, 6)
+        second, second_seqs = write_seqs(temp_dir, "second.txt", 50, 7)
+        assert run_fold(temp_dir, "-i", first, "-o", "a.tab", "-b", "stub", "-C", "cache.sqlite").returncode == 0
+        result = run_fold(temp_dir, "-i", second, "-o", "b.tab", "-b", "stub", "-C", "cache.sqlite", "-M", "60")
+        assert result.returncode == 0, result.stderr
+        assert f"{len(set(first_seqs + second_seqs)) - 60} structures evicted" in result.stdout
+
+        # The structures of the most recent run were kept
+        result = run_fold(temp_dir, "-i", second, "-o", "b.tab", "-b", "stub", "-C", "cache.sqlite")
+        assert "Folding cache: 50 hits, 0 misses" in result.stdout
+
+    @pytest.mark.skipif(shutil.which("g++") is None, reason="g++ not installed")
+    def test_fold_annotate(self, temp_dir):
+        """-s writes sequence, structure and annotation lines matching parse_secondary_structure_v2."""
+        parser = os.path.join(temp_dir, "parse_secondary_structure_v2")
+        source = str(BIN_DIR / "utils" / "parse_secondary_structure_v2.cpp")
+        subprocess.run(["g++", "-O2", "-o", parser, source], check=True)
+        filename, seqs = write_seqs(temp_dir, "seqs.txt", 200, 9)
+
+        result = run_fold(temp_dir, "-i", filename, "-o", "structures.tab", "-b", "stub")
+        assert result.returncode == 0, result.stderr
+        subprocess.run([parser, "structures.tab", "annotations.tab"], check=True, cwd=temp_dir)
+        with open(os.path.join(temp_dir, "structures.tab")) as f:
+            structures = f.read().split("\n")[:-1]
+        with open(os.path.join(temp_dir, "annotations.tab")) as f:
+            annotations = f.read().split("\n")[:-1]
+
+        result = run_fold(temp_dir, "-i", filename, "-o", "annotated.tab", "-b", "stub", "-s")
+        assert result.returncode == 0, result.stderr
+        with open(os.path.join(temp_dir, "annotated.tab")) as f:
+            lines = f.read().split("\n")[:-1]
+        assert lines == [f"{a}\t{b}\t{c}" for a, b, c in zip(seqs, structures, annotations)]
+
+    @pytest.mark.skipif(shutil.which("RNAfold") is None, reason="RNAfold not installed")
+    def test_fold_rnafold_matches_cli(self, temp_dir):
+        """The rnafold backend returns the centroid structures of RNAfold -p."""
+        filename, seqs = write_seqs(temp_dir, "seqs.txt", 20, 4)
+        result = run_fold(temp_dir, "-i", filename, "-o", "structures.tab", "-j", "2", "-c", "100")
+        assert result.returncode == 0, result.stderr
+        cli = subprocess.run(
+            ["RNAfold", "-p", "--noPS"],
+            input="".join(s + "\n" for s in seqs),
+            capture_output=True,
+            text=True,
+            cwd=temp_dir,
+        )
+        with open(os.path.join(temp_dir, "structures.tab")) as f:
+            assert f.read().split("\n")[:-1] == [line.split(" ")[0] for line in cli.stdout.split("\n")[3::5]]
@@ -6,6 +6,7 @@ import sys
 from pathlib import Path
 
 import numpy as np
+import pytest
 
 BIN_DIR = Path(__file__).parent.parent / "bin"
 
@@ -146,3 +147,25 @@ class TestPRIESTESSModelTesting:
         )
         assert result.returncode == 1
         assert "Error loading model" in result.stderr
+
+    def test_model_testing_feature_matrix(self, temp_dir, synthetic_training_data, synthetic_model):
+        """A float32 feature matrix (*.npy with a .columns file) gives the same AUROC as its table."""
+        with open(synthetic_training_data) as f:
+            columns = f.readline().split()
+        matrix = os.path.join(temp_dir, "training_data.npy")
+        np.save(matrix, np.loadtxt(synthetic_training_data, delimiter="\t", skiprows=1).astype(np.float32))
+        with open(os.path.join(temp_dir, "training_data.columns"), "w") as f:
+            f.write("\n".join(columns) + "\n")
+
+        aurocs = []
+        for data, name in [(synthetic_training_data, "table"), (matrix, "matrix")]:
+            result = subprocess.run(
+                [sys.executable, str(BIN_DIR / "test_PRIESSTESS_model.py"), data, data, synthetic_model, name],
+                capture_output=True,
+                text=True,
+                cwd=temp_dir,
+            )
+            assert result.returncode == 0, result.stderr
+            with open(os.path.join(temp_dir, f"test_test_model_ON_{name}_auroc.tab")) as f:
+                aurocs.append(float(f.read()))
+        assert aurocs[0] == pytest.approx(aurocs[1])
@@ -0,0 +1,76 @@
+"""Tests for parse_secondary_structure.py."""
+
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+BIN_DIR = Path(__file__).parent.parent / "bin"
+
+
+def random_structure(rng, length):
+    """Random balanced dot-bracket structure."""
+    structure = []
+    depth = 0
+    for i in range(length):
+        r = rng.random()
+        if depth and (length - i <= depth or r < 0.3):
+            structure.append(")")
+            depth -= 1
+        elif r < 0.6 and length - i > depth + 1:
+            structure.append("(")
+            depth += 1
+        else:
+            structure.append(".")
+    return "".join(structure)
+
+
+def run_parse(temp_dir, *args):
+    return subprocess.run(
+        [sys.executable, str(BIN_DIR / "parse_secondary_structure.py")] + list(args),
+        capture_output=True,
+        text=True,
+        cwd=temp_dir,
+    )
+
+
+class TestParseSecondaryStructure:
+    """Tests for the parse_secondary_structure.py script."""
+
+    def test_parse_loop_types(self, temp_dir):
+        """Hairpin, bulge, internal, multi and external loops; lines without unpaired bases are skipped."""
+        with open(os.path.join(temp_dir, "structures.tab"), "w") as f:
+            f.write("..((..((...))..((...))..))..\n.((.((...)).))...((...))\t-3.1\n(())\n((((...)).))\n")
+        result = run_parse(temp_dir, "structures.tab", "annotations.tab")
+        assert result.returncode == 0, result.stderr
+        with open(os.path.join(temp_dir, "annotations.tab")) as f:
+            assert f.read() == "EELLMMLLHHHRRMMLLHHHRRMMRREE\nELLTLLHHHRRTRREEELLHHHRR\nLLLLHHHRRBRR\n"
+
+    def test_parse_unbalanced_structure(self, temp_dir):
+        """Unbalanced brackets are reported."""
+        with open(os.path.join(temp_dir, "structures.tab"), "w") as f:
+            f.write("((...)\n")
+        result = run_parse(temp_dir, "structures.tab", "annotations.tab")
+        assert result.returncode == 1
+        assert "Unbalanced" in result.stderr
+
+    @pytest.mark.skipif(shutil.which("g++") is None, reason="g++ not installed")
+    def test_parse_matches_binary(self, temp_dir):
+        """Random structures are annotated the same as by parse_secondary_structure_v2."""
+        parser = os.path.join(temp_dir, "parse_secondary_structure_v2")
+        subprocess.run(
+            ["g++", "-O2", "-o", parser, str(BIN_DIR / "utils" / "parse_secondary_structure_v2.cpp")], check=True
+        )
+        rng = np.random.default_rng(4)
+        with open(os.path.join(temp_dir, "structures.tab"), "w") as f:
+            f.write("".join(random_structure(rng, int(rng.integers(1, 120))) + "\n" for _ in range(5000)))
+
+        subprocess.run([parser, "structures.tab", "expected.tab"], check=True, cwd=temp_dir)
+        result = run_parse(temp_dir, "structures.tab", "annotations.tab")
+        assert result.returncode == 0, result.stderr
+        with open(os.path.join(temp_dir, "expected.tab")) as f, open(os.path.join(temp_dir, "annotations.tab")) as g:
+            assert g.read() == f.read()
@@ -5,9 +5,92 @@ import subprocess
 import sys
 from pathlib import Path
 
+import numpy as np
+import pytest
+
 BIN_DIR = Path(__file__).parent.parent / "bin"
 
 
+def reference_scan(sequence, PFM, topN, letters="ACGU"):
+    """Window-by-window scoring as originally implemented in PFM_scan.py."""
+    if len(sequence) < len(PFM) + topN - 1:
+        return 0
+    scores = []
+    for i in range(1 + len(sequence) - len(PFM)):
+        subseq = sequence[i : i + len(PFM)]
+        scores.append(np.prod(PFM[range(len(PFM)), [letters.index(j) for j in subseq]]))
+    return sum(np.sort(scores)[-topN:])
+
+
+def read_scan_output(filename):
+    """Read a *_PFM_scan_sum_top_N.tab file into a header and a dict of rows."""
+    with open(filename) as f:
+        header = f.readline().strip().split("\t")
+        rows = {line.split("\t")[0]: [float(i) for i in line.strip().split("\t")[1:]] for line in f}
+    return header, rows
+
+
+# Letters of the seq-struct-28 alphabet
+LETTERS_28 = "ABCDEFGHIJKLMNOPQRSTUVWXYZab"
+
+
+def random_PFMs(rng, widths, letters="ACGU", prefix="motif-", concentration=1.0):
+    """Random PFMs (position x letter) of the given widths, named <prefix>1, <prefix>2, ..."""
+    return {
+        f"{prefix}{k + 1}": rng.dirichlet(np.full(len(letters), concentration), size=width)
+        for k, width in enumerate(widths)
+    }
+
+
+def write_PFMs(directory, PFMs, letters="ACGU"):
+    """Write each PFM to <name>.txt in the letter x position format read by PFM_scan.py."""
+    for name, PFM in PFMs.items():
+        with open(os.path.join(directory, name + ".txt"), "w") as f:
+            for j, letter in enumerate(letters):
+                f.write(letter + "\t" + "\t".join(str(v) for v in PFM[:, j]) + "\n")
+
+
+def random_sequences(rng, lengths, letters="ACGU"):
+    """Random sequences of the given lengths."""
+    return ["".join(rng.choice(list(letters), size=n)) for n in lengths]
+
+
+def write_fasta(filename, sequences, name="read"):
+    """Write sequences named <name>_1, <name>_2, ..."""
+    with open(filename, "w") as f:
+        for i, sequence in enumerate(sequences):
+            f.write(f">{name}_{i + 1}\n{sequence}\n")
+
+
+def run_scan(cwd, *args):
+    return subprocess.run(
+        [sys.executable, str(BIN_DIR / "PFM_scan.py")] + list(args), capture_output=True, text=True, cwd=cwd
+    )
+
+
+def check_hits(output, sequences, PFMs, threshold, letters="ACGU"):
+    """Compare a *_PFM_scan_hits_T.tab table with the windows of read_<i> scoring at least threshold x best."""
+    expected = []
+    for i, sequence in enumerate(sequences):
+        for start in range(len(sequence)):
+            for name, PFM in PFMs.items():
+                if start + len(PFM) <= len(sequence):
+                    score = reference_scan(sequence[start : start + len(PFM)], PFM, 1, letters)
+                    if score >= threshold * PFM.max(axis=1).prod():
+                        expected.append((f"read_{i + 1}", name, start + 1, score))
+    # PFMs of a window are in PFM file order, which depends on the directory listing
+    expected.sort(key=lambda hit: (int(hit[0].split("_")[1]), hit[2], int(hit[1].split("-")[1])))
+
+    lines = output.strip().split("\n")
+    assert lines[0] == "seq_id\tPFM\tstart\tscore"
+    hits = [line.split("\t") for line in lines[1:]]
+    assert len(hits) == len(expected) > 0
+    hits.sort(key=lambda hit: (int(hit[0].split("_")[1]), int(hit[2]), int(hit[1].split("-")[1])))
+    for hit, (seq_id, PFM_name, start, score) in zip(hits, expected):
+        assert hit[:3] == [seq_id, PFM_name, str(start)]
+        assert float(hit[3]) == pytest.approx(score, rel=1e-12)
+
+
 class TestPFMScan:
     """Tests for the PFM_scan.py script."""
 
@@ -189,3 +272,274 @@ class TestPFMScan:
             if result.returncode != 0:
                 # If it fails, make sure it's not due to bad alphabet
                 assert "Invalid alphabet" not in result.stderr
+
+    @pytest.mark.parametrize("topn", [1, 3, 5])
+    def test_pfm_scan_matches_reference(self, temp_dir, topn):
+        """Vectorized scores match window-by-window products, including zeros and short sequences."""
+        rng = np.random.default_rng(7)
+        PFMs = random_PFMs(rng, [3, 6, 6])
+        for PFM in PFMs.values():
+            PFM[0, 2] = 0
+        write_PFMs(temp_dir, PFMs)
+        sequences = random_sequences(rng, [4, 7, 12, 40, 40, 101])
+        write_fasta(os.path.join(temp_dir, "probes.fa"), sequences, "fg")
+
+        result = run_scan(temp_dir, "-a", "seq-4", "-f", "probes.fa", "-p", "motif-", "-n", str(topn))
+        assert result.returncode == 0, result.stderr
+
+        header, rows = read_scan_output(os.path.join(temp_dir, f"probes_PFM_scan_sum_top_{topn}.tab"))
+        for i, sequence in enumerate(sequences):
+            for name, score in zip(header[1:], rows[f"fg_{i + 1}"]):
+                assert score == pytest.approx(reference_scan(sequence, PFMs[name], topn), rel=1e-12, abs=1e-300)
+
+    def test_pfm_scan_invalid_letter(self, temp_dir, simple_pfm):
+        """Letters outside the alphabet are reported instead of raising a traceback."""
+        write_fasta(os.path.join(temp_dir, "bad.fa"), ["ACGTACGU"])
+        result = run_scan(temp_dir, "-a", "seq-4", "-f", "bad.fa", "-p", "test_motif_", "-n", "1")
+        assert result.returncode == 1
+        assert "not in alphabet" in result.stderr
+
+    def test_pfm_scan_multiple_alphabets_and_files(self, temp_dir):
+        """Several alphabets and files scanned in one call match separate calls."""
+        rng = np.random.default_rng(3)
+        letters = {"seq-4": "ACGU", "struct-2": "PU"}
+        for alph, alph_letters in letters.items():
+            os.makedirs(os.path.join(temp_dir, alph))
+            write_PFMs(os.path.join(temp_dir, alph), random_PFMs(rng, [4, 5], alph_letters, "PFM-"), alph_letters)
+            for name in ["fg_LR", "bg_LR"]:
+                sequences = random_sequences(rng, [20] * 5, alph_letters)
+                write_fasta(os.path.join(temp_dir, alph, name + ".fa"), sequences, name[:2])
+
+        files = "{alph}/fg_LR.fa,{alph}/bg_LR.fa"
+        result = run_scan(temp_dir, "-n", "2", "-a", "seq-4,struct-2", "-f", files, "-p", "{alph}/PFM", "-o", "{alph}")
+        assert result.returncode == 0, result.stderr
+
+        for alph in letters:
+            for name in ["fg_LR", "bg_LR"]:
+                with open(os.path.join(temp_dir, alph, f"{name}_PFM_scan_sum_top_2.tab")) as f:
+                    combined = f.read()
+                result = run_scan(os.path.join(temp_dir, alph), "-n", "2", "-a", alph, "-f", f"{name}.fa", "-p", "PFM")
+                assert result.returncode == 0
+                with open(os.path.join(temp_dir, alph, f"{name}_PFM_scan_sum_top_2.tab")) as f:
+                    assert f.read() == combined
+
+    def test_pfm_scan_annotation_table(self, temp_dir, simple_fasta, simple_pfm):
+        """Alphabet annotation tables are scanned directly using the header file."""
+        header = os.path.join(temp_dir, "annotation_alphabets_header.tab")
+        with open(header, "w") as f:
+            f.write("ID\tstruct-2\tseq-4\n2\t6\t7\n")
+        with open(simple_fasta) as f:
+            lines = f.read().split()
+        with open(os.path.join(temp_dir, "fg_alphabet_annotations.tab"), "w") as f:
+            for i in range(0, len(lines), 2):
+                f.write(lines[i][1:] + "\t" + "P" * len(lines[i + 1]) + "\t" + lines[i + 1] + "\n")
+
+        command = ["-a", "seq-4", "-p", "test_motif_", "-n", "2"]
+        result = run_scan(temp_dir, *command, "-f", "fg_alphabet_annotations.tab", "-H", header)
+        assert result.returncode == 0, result.stderr
+        result = run_scan(temp_dir, *command, "-f", simple_fasta)
+        assert result.returncode == 0
+
+        with open(os.path.join(temp_dir, "fg_PFM_scan_sum_top_2.tab")) as f:
+            from_table = f.read()
+        with open(os.path.join(temp_dir, "test_PFM_scan_sum_top_2.tab")) as f:
+            assert f.read() == from_table
+
+    def test_pfm_scan_annotation_table_requires_header(self, temp_dir, simple_pfm):
+        """Annotation tables cannot be scanned without -H."""
+        with open(os.path.join(temp_dir, "fg_alphabet_annotations.tab"), "w") as f:
+            f.write("fg_1\tACGUACGU\n")
+        result = run_scan(temp_dir, "-a", "seq-4", "-f", "fg_alphabet_annotations.tab", "-p", "test_motif_", "-n", "1")
+        assert result.returncode == 1
+        assert "-H is required" in result.stderr
+
+    def test_pfm_scan_workers_keep_order(self, temp_dir, simple_pfm):
+        """Scanning with a process pool gives the same rows in the same order."""
+        rng = np.random.default_rng(11)
+        write_fasta(os.path.join(temp_dir, "reads.fa"), random_sequences(rng, rng.integers(2, 80, size=300)))
+
+        outputs = []
+        for workers in ["1", "3"]:
+            result = run_scan(temp_dir, "-a", "seq-4", "-f", "reads.fa", "-p", "test_motif_", "-n", "2", "-w", workers)
+            assert result.returncode == 0, result.stderr
+            with open(os.path.join(temp_dir, "reads_PFM_scan_sum_top_2.tab")) as f:
+                outputs.append(f.read())
+        assert outputs[0] == outputs[1]
+        assert outputs[1].split("\n")[1].startswith("read_1\t")
+
+    def test_pfm_scan_variable_length_reads(self, temp_dir):
+        """Reads of mixed lengths scored together match per-read scoring, including the short-read rule."""
+        rng = np.random.default_rng(23)
+        PFMs = random_PFMs(rng, [5])
+        write_PFMs(temp_dir, PFMs)
+        sequences = random_sequences(rng, rng.integers(0, 16, size=200))
+        write_fasta(os.path.join(temp_dir, "reads.fa"), sequences)
+
+        result = run_scan(temp_dir, "-a", "seq-4", "-f", "reads.fa", "-p", "motif-", "-n", "3")
+        assert result.returncode == 0, result.stderr
+
+        header, rows = read_scan_output(os.path.join(temp_dir, "reads_PFM_scan_sum_top_3.tab"))
+        for i, sequence in enumerate(sequences):
+            assert rows[f"read_{i + 1}"][0] == pytest.approx(reference_scan(sequence, PFMs["motif-1"], 3), rel=1e-12)
+
+    def test_pfm_scan_binary_output(self, temp_dir):
+        """-b writes the scores of the text table as a float32 matrix with a column name sidecar."""
+        rng = np.random.default_rng(29)
+        write_PFMs(temp_dir, random_PFMs(rng, [3, 6]))
+        write_fasta(os.path.join(temp_dir, "reads.fa"), random_sequences(rng, rng.integers(0, 20, size=50)))
+
+        for extra in [[], ["-b"]]:
+            result = run_scan(temp_dir, "-a", "seq-4", "-f", "reads.fa", "-p", "motif-", "-n", "2", *extra)
+            assert result.returncode == 0, result.stderr
+
+        header, rows = read_scan_output(os.path.join(temp_dir, "reads_PFM_scan_sum_top_2.tab"))
+        matrix = np.load(os.path.join(temp_dir, "reads_PFM_scan_sum_top_2.npy"))
+        assert matrix.dtype == np.float32
+        with open(os.path.join(temp_dir, "reads_PFM_scan_sum_top_2.columns")) as f:
+            assert f.read().split() == header[1:]
+        np.testing.assert_array_equal(matrix, np.array(list(rows.values()), dtype=np.float32))
+
+    def test_pfm_scan_binary_double(self, temp_dir):
+        """-b -d writes the float64 scores of the text table unchanged, -d alone is rejected."""
+        rng = np.random.default_rng(43)
+        write_PFMs(temp_dir, random_PFMs(rng, [4, 7]))
+        write_fasta(os.path.join(temp_dir, "reads.fa"), random_sequences(rng, rng.integers(0, 20, size=50)))
+
+        for extra in [[], ["-b", "-d"]]:
+            result = run_scan(temp_dir, "-a", "seq-4", "-f", "reads.fa", "-p", "motif-", "-n", "2", *extra)
+            assert result.returncode == 0, result.stderr
+        header, rows = read_scan_output(os.path.join(temp_dir, "reads_PFM_scan_sum_top_2.tab"))
+        matrix = np.load(os.path.join(temp_dir, "reads_PFM_scan_sum_top_2.npy"))
+        assert matrix.dtype == np.float64
+        np.testing.assert_array_equal(matrix, np.array(list(rows.values())))
+
+        result = run_scan(temp_dir, "-a", "seq-4", "-f", "reads.fa", "-p", "motif-", "-n", "2", "-d")
+        assert result.returncode == 1
+        assert "-d can only be used with -b" in result.stderr
+
+    @pytest.mark.parametrize("extra", [[], ["-w", "3"], ["-P", "int16"]])
+    def test_pfm_scan_unique_sequences(self, temp_dir, simple_pfm, extra):
+        """-u scores each distinct read once and writes the same table."""
+        rng = np.random.default_rng(37)
+        distinct = random_sequences(rng, rng.integers(0, 30, size=20))
+        write_fasta(os.path.join(temp_dir, "reads.fa"), [distinct[k] for k in rng.integers(0, 20, size=400)])
+
+        outputs = []
+        for unique in [[], ["-u"]]:
+            result = run_scan(
+                temp_dir, "-a", "seq-4", "-f", "reads.fa", "-p", "test_motif_", "-n", "2", *extra, *unique
+            )
+            assert result.returncode == 0, result.stderr
+            with open(os.path.join(temp_dir, "reads_PFM_scan_sum_top_2.tab")) as f:
+                outputs.append(f.read())
+        assert outputs[0] == outputs[1]
+
+    @pytest.mark.parametrize("precision,rel", [("float32", 1e-5), ("int16", 2e-2)])
+    def test_pfm_scan_reduced_precision(self, temp_dir, precision, rel):
+        """float32 and quantized int16 scores stay close to the float64 scores."""
+        rng = np.random.default_rng(31)
+        write_PFMs(temp_dir, random_PFMs(rng, [6]))
+        write_fasta(os.path.join(temp_dir, "reads.fa"), random_sequences(rng, rng.integers(0, 30, size=100)))
+
+        outputs = []
+        for extra in [[], ["-P", precision]]:
+            result = run_scan(temp_dir, "-a", "seq-4", "-f", "reads.fa", "-p", "motif-", "-n", "2", *extra)
+            assert result.returncode == 0, result.stderr
+            outputs.append(read_scan_output(os.path.join(temp_dir, "reads_PFM_scan_sum_top_2.tab"))[1])
+        assert list(outputs[0]) == list(outputs[1])
+        for seq_id, row in outputs[0].items():
+            assert outputs[1][seq_id][0] == pytest.approx(row[0], rel=rel)
+
+    def test_pfm_scan_invalid_precision(self, temp_dir, simple_fasta, simple_pfm):
+        """Unknown precisions are rejected."""
+        result = run_scan(temp_dir, "-a", "seq-4", "-f", simple_fasta, "-p", "test_motif_", "-n", "1", "-P", "float16")
+        assert result.returncode == 2
+        assert "invalid choice" in result.stderr
+
+    def test_pfm_scan_threshold_hits(self, temp_dir):
+        """-t reports exactly the windows scoring above the threshold, with any number of workers."""
+        rng = np.random.default_rng(37)
+        PFMs = random_PFMs(rng, [4, 4, 7], concentration=0.3)
+        write_PFMs(temp_dir, PFMs)
+        sequences = random_sequences(rng, rng.integers(0, 40, size=150))
+        write_fasta(os.path.join(temp_dir, "reads.fa"), sequences)
+
+        outputs = []
+        for workers in ["1", "3"]:
+            result = run_scan(temp_dir, "-a", "seq-4", "-f", "reads.fa", "-p", "motif-", "-t", "0.05", "-w", workers)
+            assert result.returncode == 0, result.stderr
+            with open(os.path.join(temp_dir, "reads_PFM_scan_hits_0.05.tab")) as f:
+                outputs.append(f.read())
+        assert outputs[0] == outputs[1]
+        check_hits(outputs[0], sequences, PFMs, 0.05)
+
+    @pytest.mark.parametrize(
+        "extra,message",
+        [(["-t", "1.5"], "threshold"), (["-t", "0.5", "-b"], "-b cannot"), (["-t", "0.5", "-u"], "-u cannot")],
+    )
+    def test_pfm_scan_threshold_invalid(self, temp_dir, simple_fasta, simple_pfm, extra, message):
+        """Thresholds outside (0, 1] and binary output of hits are rejected."""
+        result = run_scan(temp_dir, "-a", "seq-4", "-f", simple_fasta, "-p", "test_motif_", *extra)
+        assert result.returncode == 1
+        assert message in result.stderr
+
+    @pytest.mark.parametrize(
+        "alph,letters,widths", [("struct-2", "PU", [3, 12]), ("seq-struct-28", LETTERS_28, [3, 5])]
+    )
+    def test_pfm_scan_kmer_tables_and_general_kernel(self, temp_dir, alph, letters, widths):
+        """PFMs scored by k-mer table lookup and by the general kernel (large tables) both match the reference."""
+        rng = np.random.default_rng(41)
+        PFMs = random_PFMs(rng, widths, letters)
+        write_PFMs(temp_dir, PFMs, letters)
+        sequences = random_sequences(rng, rng.integers(0, 30, size=40), letters)
+        write_fasta(os.path.join(temp_dir, "probes.fa"), sequences, "fg")
+
+        result = run_scan(temp_dir, "-a", alph, "-f", "probes.fa", "-p", "motif-", "-n", "2")
+        assert result.returncode == 0, result.stderr
+
+        header, rows = read_scan_output(os.path.join(temp_dir, "probes_PFM_scan_sum_top_2.tab"))
+        for i, sequence in enumerate(sequences):
+            for name, score in zip(header[1:], rows[f"fg_{i + 1}"]):
+                assert score == pytest.approx(reference_scan(sequence, PFMs[name], 2, letters), rel=1e-12)
+
+    @pytest.mark.parametrize("extra", [[], ["-b"], ["-P", "int16", "-w", "2"]])
+    def test_pfm_scan_several_topn(self, temp_dir, extra):
+        """Several -n values are scored in one pass and give the same files as one scan per value."""
+        rng = np.random.default_rng(43)
+        write_PFMs(temp_dir, random_PFMs(rng, [3, 5, 11]))
+        write_fasta(os.path.join(temp_dir, "reads.fa"), random_sequences(rng, rng.integers(0, 20, size=300)))
+
+        outputs = {}
+        for outdir, topns in [("single", ["1", "3", "5"]), ("several", ["5,1,3"])]:
+            os.makedirs(os.path.join(temp_dir, outdir))
+            for topn in topns:
+                result = run_scan(
+                    temp_dir, "-a", "seq-4", "-f", "reads.fa", "-p", "motif-", "-n", topn, "-o", outdir, *extra
+                )
+                assert result.returncode == 0, result.stderr
+            outputs[outdir] = {}
+            for name in sorted(os.listdir(os.path.join(temp_dir, outdir))):
+                with open(os.path.join(temp_dir, outdir, name), "rb") as f:
+                    outputs[outdir][name] = f.read()
+        assert len(outputs["single"]) == (6 if "-b" in extra else 3)
+        assert outputs["several"] == outputs["single"]
+
+    def test_pfm_scan_threshold_large_alphabet(self, temp_dir):
+        """-t finds the same hits for a large alphabet with more PFMs of a width than fit in a byte of codes."""
+        rng = np.random.default_rng(47)
+        # 12 seq-struct-28 PFMs of width 4: letter code x PFM index exceeds 255
+        PFMs = random_PFMs(rng, [4] * 12 + [6], LETTERS_28, concentration=0.1)
+        write_PFMs(temp_dir, PFMs, LETTERS_28)
+        sequences = random_sequences(rng, rng.integers(0, 30, size=60), LETTERS_28)
+        write_fasta(os.path.join(temp_dir, "reads.fa"), sequences)
+
+        result = run_scan(temp_dir, "-a", "seq-struct-28", "-f", "reads.fa", "-p", "motif-", "-t", "0.001")
+        assert result.returncode == 0, result.stderr
+        with open(os.path.join(temp_dir, "reads_PFM_scan_hits_0.001.tab")) as f:
+            check_hits(f.read(), sequences, PFMs, 0.001, LETTERS_28)
+
+    def test_pfm_scan_topn_not_integer(self, temp_dir, simple_fasta, simple_pfm):
+        """Values of -n that are not integers are reported as given."""
+        result = run_scan(temp_dir, "-a", "seq-4", "-f", simple_fasta, "-p", "test_motif_", "-n", "2,x")
+        assert result.returncode == 1
+        assert "comma-separated list of positive integers, got '2,x'" in result.stderr
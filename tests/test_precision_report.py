@@ -0,0 +1,94 @@
+"""Tests for precision_report.py."""
+
+import os
+import pickle
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+
+BIN_DIR = Path(__file__).parent.parent / "bin"
+
+
+def write_scores(filename, scores, n_fg, dtype=np.float32):
+    """Write scores as a feature matrix with a class column (first n_fg rows are fg)."""
+    classes = (np.arange(len(scores)) < n_fg).astype(float)
+    np.save(filename, np.column_stack([classes, scores]).astype(dtype))
+    with open(filename[:-4] + ".columns", "w") as f:
+        f.write("class\n" + "".join(f"seq-4_PFM-{k + 1}\n" for k in range(scores.shape[1])))
+
+
+def run_report(*args, cwd=None):
+    result = subprocess.run(
+        [sys.executable, str(BIN_DIR / "precision_report.py")] + list(args),
+        capture_output=True,
+        text=True,
+        cwd=cwd,
+    )
+    report = dict(line.split("\t") for line in result.stdout.strip().split("\n") if line)
+    return result, report
+
+
+class TestPrecisionReport:
+    """Tests for the precision_report.py script."""
+
+    def test_report_errors(self, temp_dir):
+        """Absolute, relative and rank errors are measured per feature."""
+        scores = np.array([[1.0, 0.5], [2.0, 0.25], [3.0, 0.125], [4.0, 0.0625]])
+        reference = os.path.join(temp_dir, "scores_float64.npy")
+        compared = os.path.join(temp_dir, "scores.npy")
+        write_scores(reference, scores, 2, np.float64)
+        changed = scores.copy()
+        changed[0, 1] = 0.0
+        write_scores(compared, changed, 2)
+
+        result, report = run_report("-r", reference, "-c", compared)
+        assert result.returncode == 0, result.stderr
+        assert float(report["max_abs_error"]) == 0.5
+        assert float(report["max_rel_error"]) == 1.0
+        assert float(report["max_rank_error"]) == 3.0
+        assert report["worst_feature"] == "seq-4_PFM-2"
+        assert "auroc_float64" not in report
+
+    def test_report_auroc(self, temp_dir):
+        """The AUROC of the model is reported on both score sets."""
+        from sklearn.linear_model import LogisticRegression
+
+        rng = np.random.default_rng(4)
+        scores = rng.random((40, 3))
+        scores[:20, 0] += 0.5
+        # Scores that float32 holds exactly, so that both score sets agree
+        scores = scores.astype(np.float32).astype(np.float64)
+        reference = os.path.join(temp_dir, "scores_float64.npy")
+        compared = os.path.join(temp_dir, "scores.npy")
+        write_scores(reference, scores, 20, np.float64)
+        write_scores(compared, scores, 20)
+        model = os.path.join(temp_dir, "model.sav")
+        pickle.dump(LogisticRegression().fit(scores, np.arange(40) < 20), open(model, "wb"))
+
+        result, report = run_report("-r", reference, "-c", compared, "-m", model, "-T", reference)
+        assert result.returncode == 0, result.stderr
+        assert float(report["max_abs_error"]) == 0
+        assert 0.5 < float(report["auroc_float64"]) <= 1
+        assert float(report["auroc_difference"]) == 0
+
+    def test_report_shape_mismatch(self, temp_dir):
+        """Score sets of different probes or features are rejected."""
+        reference = os.path.join(temp_dir, "scores_float64.npy")
+        compared = os.path.join(temp_dir, "scores.npy")
+        write_scores(reference, np.ones((4, 2)), 2, np.float64)
+        write_scores(compared, np.ones((4, 3)), 2)
+        result, report = run_report("-r", reference, "-c", compared)
+        assert result.returncode == 1
+        assert "differ" in result.stderr
+
+    def test_report_float32_reference(self, temp_dir):
+        """Reference scores rounded to float32 are rejected."""
+        reference = os.path.join(temp_dir, "scores_float64.npy")
+        compared = os.path.join(temp_dir, "scores.npy")
+        write_scores(reference, np.ones((4, 2)), 2)
+        write_scores(compared, np.ones((4, 2)), 2)
+        result, report = run_report("-r", reference, "-c", compared)
+        assert result.returncode == 1
+        assert "not float64" in result.stderr
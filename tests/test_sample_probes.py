@@ -0,0 +1,62 @@
+"""Tests for sample_probes.py."""
+
+import gzip
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BIN_DIR = Path(__file__).parent.parent / "bin"
+
+
+def run_sample(temp_dir, *args):
+    return subprocess.run(
+        [sys.executable, str(BIN_DIR / "sample_probes.py")] + list(args),
+        capture_output=True,
+        text=True,
+        cwd=temp_dir,
+    )
+
+
+def read_lines(filename):
+    with open(filename) as f:
+        return f.read().split("\n")[:-1]
+
+
+class TestSampleProbes:
+    """Tests for the sample_probes.py script."""
+
+    def test_sample_sets(self, temp_dir):
+        """Each file gives N * percentage / 100 distinct probes per set, each set in input order."""
+        fg = [f"ACGU{i:05d}".replace("0", "A") for i in range(1000)]
+        bg = [f"UGCA{i:05d}".replace("0", "G") for i in range(800)]
+        with gzip.open(os.path.join(temp_dir, "fg.txt.gz"), "wt") as f:
+            f.write("".join(s + "\r\n" for s in fg) + "ACGNA\n")
+        with open(os.path.join(temp_dir, "bg.txt"), "w") as f:
+            f.write("".join(s + "\n" for s in bg))
+
+        outputs = []
+        for seed in ["7", "7", "8"]:
+            result = run_sample(
+                temp_dir, "-i", "fg.txt.gz,bg.txt", "-o", "fg_seqs.txt,bg_seqs.txt", "-p", "50,25,20", "-s", seed
+            )
+            assert result.returncode == 0, result.stderr
+            # N defaults to the number of probes of the smaller file
+            assert result.stdout == "800\n"
+            outputs.append([read_lines(os.path.join(temp_dir, name)) for name in ["fg_seqs.txt", "bg_seqs.txt"]])
+        assert outputs[0] == outputs[1]
+        assert outputs[0] != outputs[2]
+
+        for sampled, probes in zip(outputs[0], [fg, bg]):
+            assert len(sampled) == 400 + 200 + 160
+            assert len(set(sampled)) == len(sampled) and set(sampled) <= set(probes)
+            for start, end in [(0, 400), (400, 600), (600, 760)]:
+                assert sampled[start:end] == sorted(sampled[start:end], key=probes.index)
+
+    def test_sample_too_few_probes(self, temp_dir):
+        """An N larger than a file is reported."""
+        with open(os.path.join(temp_dir, "fg.txt"), "w") as f:
+            f.write("ACGU\n" * 100)
+        result = run_sample(temp_dir, "-i", "fg.txt", "-o", "fg_seqs.txt", "-p", "50,25,25", "-N", "1000")
+        assert result.returncode == 1
+        assert "fewer than" in result.stderr
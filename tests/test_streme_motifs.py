@@ -0,0 +1,81 @@
+"""Tests for streme_motifs.py."""
+
+import math
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BIN_DIR = Path(__file__).parent.parent / "bin"
+
+
+def write_streme(temp_dir, motifs):
+    """Write a streme.txt for the struct-2 alphabet; motifs are (width, nsites, "P= 1e-5" style value)."""
+    lines = ['ALPHABET "RNA struct-2"', 'U "Unpaired"', 'P "Paired"', "? = UP", "END ALPHABET", ""]
+    for rank, (width, nsites, value) in enumerate(motifs, 1):
+        lines.append(f"MOTIF {rank}-{'U' * width} STREME-{rank}")
+        lines.append(f"letter-probability matrix: alength= 2 w= {width} nsites= {nsites} {value}")
+        lines += [f" 0.{rank}00000 0.{9 - rank}00000" for _ in range(width)]
+        lines.append("")
+    with open(os.path.join(temp_dir, "streme.txt"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def run_motifs(temp_dir, *args):
+    return subprocess.run(
+        [sys.executable, str(BIN_DIR / "streme_motifs.py"), "streme.txt"] + list(args),
+        capture_output=True,
+        text=True,
+        cwd=temp_dir,
+    )
+
+
+class TestStremeMotifs:
+    """Tests for the streme_motifs.py script."""
+
+    def test_motifs_cutoff(self, temp_dir):
+        """Motifs below the Bonferroni cutoff get a PFM, E-values are divided by nsites, the last 3 are ignored."""
+        write_streme(
+            temp_dir,
+            [
+                (4, 100, "P= 1.5e-400"),
+                (5, 10, "E= 2.0e-002"),
+                (4, 10, "P= 3.0e-003"),
+                (6, 10, "P= 1.0e-010"),
+                (4, 10, "P= 1.0e-001"),
+                (4, 10, "P= 1.0e-001"),
+                (4, 10, "P= 1.0e-001"),
+            ],
+        )
+        result = run_motifs(temp_dir)
+        assert result.returncode == 0, result.stderr
+        assert sorted(f for f in os.listdir(temp_dir) if f.startswith("PFM")) == [
+            "PFM-1.txt",
+            "PFM-2.txt",
+            "PFM-4.txt",
+        ]
+        with open(os.path.join(temp_dir, "PFM-2.txt")) as f:
+            assert f.read() == "U" + "\t0.200000" * 5 + "\nP" + "\t0.700000" * 5 + "\n"
+
+        with open(os.path.join(temp_dir, "motifs.tab")) as f:
+            manifest = [line.split("\t") for line in f.read().split("\n")[:-1]]
+        assert manifest[0] == ["rank", "motif", "width", "nsites", "log2_p", "PFM"]
+        assert [row[0] for row in manifest[1:]] == ["1", "2", "3", "4"]
+        assert [row[5] for row in manifest[1:]] == ["PFM-1.txt", "PFM-2.txt", "NA", "PFM-4.txt"]
+        assert float(manifest[1][4]) < -1300
+        assert abs(float(manifest[2][4]) - math.log2(0.02 / 10)) < 1e-5
+
+    def test_motifs_max_motifs(self, temp_dir):
+        """Only motifs ranked up to -m get a PFM."""
+        write_streme(temp_dir, [(4, 10, "P= 1.0e-010")] * 3 + [(4, 10, "P= 1.0e-001")] * 3)
+        result = run_motifs(temp_dir, "-m", "2")
+        assert result.returncode == 0, result.stderr
+        assert sorted(f for f in os.listdir(temp_dir) if f.startswith("PFM")) == ["PFM-1.txt", "PFM-2.txt"]
+
+    def test_motifs_invalid_file(self, temp_dir):
+        """Motifs without a width are reported."""
+        with open(os.path.join(temp_dir, "streme.txt"), "w") as f:
+            f.write("MOTIF 1-UUU STREME-1\nletter-probability matrix: nsites= 3 P= 1e-5\n")
+        result = run_motifs(temp_dir)
+        assert result.returncode == 1
+        assert "Invalid motif" in result.stderr